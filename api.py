@@ -0,0 +1,308 @@
+# api.py — read-only JSON HTTP API next to the Streamlit UI (stdlib asyncio, no framework)
+# Run:
+#   python api.py                          # listens on HH_API_HOST:HH_API_PORT (default 127.0.0.1:8601)
+#
+# Auth: `Authorization: Bearer <token>` where token comes from auth_persist.create_token
+# ({"uid": staff id, ...}, signed with HH_APP_SECRET); the staff account must still be active.
+#
+# Endpoints (all GET, JSON):
+#   /healthz                                        no auth
+#   /patients?after=<id>&limit=<n>                  active patients, keyset-paginated by id
+#   /patients/<id>
+#   /patients/<id>/nurse_logs?date=YYYY-MM-DD&after=<id>&limit=<n>    date = care day (its night block is the night ending that morning)
+#   /patients/<id>/physio_logs?date=YYYY-MM-DD&after=<id>&limit=<n>   (date optional)
+#   /patients/<id>/medications                      active medications, one row per meal slot
+# Lists answer {"data": [...], "next": <cursor or null>}; pass next back as ?after=.
+#
+# ETags: patient-scoped resources use the patient's latest change_log id (changefeed.py) as
+# their version, so a matching If-None-Match is answered 304 before the resource query runs.
+# /patients and /patients/<id> hash the response body instead.
+#
+# Env:
+#   HH_API_HOST, HH_API_PORT
+#   HH_API_MAX_LIMIT    largest page size accepted (default 500)
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+import auth_persist
+import db
+import labels
+from queries import active_meds_summary
+
+HOST = os.getenv("HH_API_HOST", "127.0.0.1")
+PORT = int(os.getenv("HH_API_PORT", "8601") or 8601)
+MAX_LIMIT = int(os.getenv("HH_API_MAX_LIMIT", "500") or 500)
+DEFAULT_LIMIT = 100
+STAFF_TTL_S = 60
+MAX_HEADER_BYTES = 16 * 1024
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 401: "Unauthorized",
+            404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+_staff_cache = {}   # uid -> (checked at, active)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(message)
+        self.status = status
+        self.message = message or _REASONS.get(status, "")
+
+
+def q(sql, params=()):
+    """run_query(fetch=True) off the event loop."""
+    return asyncio.to_thread(db.run_query, sql, params, True)
+
+
+def _log_rows(sql, params):
+    """Log-table rows with section / field / created_by as text (the label ids stay internal)."""
+    rows = labels.decode(db.run_query, db.run_query(sql, params, True))
+    for r in rows:
+        for id_col in labels.ENCODED.values():
+            r.pop(id_col, None)
+    return rows
+
+
+# ---------------- Params ----------------
+def _int_param(qs, name, default=None, minimum=0, maximum=None):
+    raw = (qs.get(name) or [None])[0]
+    if raw in (None, ""):
+        return default
+    try:
+        v = int(raw)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer")
+    if v < minimum or (maximum is not None and v > maximum):
+        raise HTTPError(400, f"{name} out of range")
+    return v
+
+
+def _date_param(qs, name, required=False):
+    raw = (qs.get(name) or [None])[0]
+    if not raw:
+        if required:
+            raise HTTPError(400, f"{name}=YYYY-MM-DD is required")
+        return None
+    try:
+        return date.fromisoformat(raw).isoformat()
+    except ValueError:
+        raise HTTPError(400, f"{name} must be YYYY-MM-DD")
+
+
+def _page(rows, limit):
+    """Rows fetched with LIMIT limit+1 -> {"data", "next"}."""
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {"data": rows, "next": rows[-1]["id"] if more else None}
+
+
+# ---------------- Auth / versions ----------------
+async def authenticate(headers):
+    auth = headers.get("authorization", "")
+    if not auth.lower().startswith("bearer "):
+        raise HTTPError(401, "missing bearer token")
+    claims = auth_persist.verify_token(auth[7:].strip())
+    if not claims or not claims.get("uid"):
+        raise HTTPError(401, "invalid or expired token")
+    uid = claims["uid"]
+    hit = _staff_cache.get(uid)
+    if hit is None or time.monotonic() - hit[0] > STAFF_TTL_S:
+        rows = await q("SELECT is_active FROM staff WHERE id=?", (uid,))
+        hit = _staff_cache[uid] = (time.monotonic(), bool(rows and rows[0]["is_active"]))
+    if not hit[1]:
+        raise HTTPError(401, "account disabled")
+    return claims
+
+
+async def patient_version(pid):
+    rows = await q("SELECT MAX(id) AS v FROM change_log WHERE patient_id=?", (pid,))
+    return (rows[0]["v"] if rows else None) or 0
+
+
+def _etag(*parts):
+    return 'W/"' + hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:20] + '"'
+
+
+# ---------------- Handlers ----------------
+async def list_patients(qs):
+    limit = _int_param(qs, "limit", DEFAULT_LIMIT, 1, MAX_LIMIT)
+    after = _int_param(qs, "after", 0)
+    rows = await q(
+        "SELECT id, hn, first_name, last_name, ward, hospital, admission_date, updated_at "
+        "FROM patients WHERE is_active=1 AND id > ? ORDER BY id LIMIT ?",
+        (after, limit + 1),
+    )
+    return _page(rows, limit)
+
+
+async def get_patient(pid, qs):
+    rows = await q(
+        "SELECT id, hn, first_name, last_name, dob, ward, hospital, blood_group, weight, height, "
+        "underlying_disease, drug_allergy, feeding, foley, admission_date, is_active, updated_at "
+        "FROM patients WHERE id=?", (pid,),
+    )
+    if not rows:
+        raise HTTPError(404, "patient not found")
+    return rows[0]
+
+
+async def nurse_logs(pid, qs):
+    day = _date_param(qs, "date", required=True)
+    limit = _int_param(qs, "limit", DEFAULT_LIMIT, 1, MAX_LIMIT)
+    after = _int_param(qs, "after", 0)
+    rows = await asyncio.to_thread(
+        _log_rows,
+        "SELECT id, ts, care_day, shift, section, field, value, created_by, created_at, "
+        "section_id, field_id, created_by_id FROM nurse_logs "
+        "WHERE patient_id=? AND care_day=? AND id > ? ORDER BY id LIMIT ?",
+        (pid, day, after, limit + 1),
+    )
+    return _page(rows, limit)
+
+
+async def physio_logs(pid, qs):
+    day = _date_param(qs, "date")
+    limit = _int_param(qs, "limit", DEFAULT_LIMIT, 1, MAX_LIMIT)
+    after = _int_param(qs, "after", 0)
+    where_day = "AND log_date=?" if day else ""
+    rows = await asyncio.to_thread(
+        _log_rows,
+        "SELECT id, log_date, physio_type, section, field, value, created_by, created_at, "
+        "section_id, field_id, created_by_id FROM physio_logs "
+        f"WHERE patient_id=? {where_day} AND id > ? ORDER BY id LIMIT ?",
+        (pid, day, after, limit + 1) if day else (pid, after, limit + 1),
+    )
+    return _page(rows, limit)
+
+
+async def medications(pid, qs):
+    rows = await asyncio.to_thread(active_meds_summary, db.run_query, pid)
+    return {"data": rows, "next": None}
+
+
+# (pattern, handler, patient-scoped: ETag from change_log instead of the body)
+ROUTES = [
+    (re.compile(r"^/patients$"), list_patients, False),
+    (re.compile(r"^/patients/(\d+)$"), get_patient, False),
+    (re.compile(r"^/patients/(\d+)/nurse_logs$"), nurse_logs, True),
+    (re.compile(r"^/patients/(\d+)/physio_logs$"), physio_logs, True),
+    (re.compile(r"^/patients/(\d+)/medications$"), medications, True),
+]
+
+
+async def dispatch(method, target, headers):
+    """-> (status, body bytes or None, extra headers)."""
+    url = urlsplit(target)
+    if url.path == "/healthz":
+        return 200, b'{"ok":true}', {}
+    if method not in ("GET", "HEAD"):
+        raise HTTPError(405)
+    await authenticate(headers)
+    qs = parse_qs(url.query)
+    for pattern, handler, scoped in ROUTES:
+        m = pattern.match(url.path)
+        if not m:
+            continue
+        args = [int(g) for g in m.groups()]
+        inm = headers.get("if-none-match", "")
+        etag = None
+        if scoped:
+            etag = _etag(url.path, url.query, await patient_version(args[0]))
+            if etag in inm:
+                return 304, None, {"ETag": etag}
+        payload = await handler(*args, qs)
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        if etag is None:
+            etag = _etag(hashlib.sha1(body).hexdigest())
+            if etag in inm:
+                return 304, None, {"ETag": etag}
+        return 200, body, {"ETag": etag, "Cache-Control": "private, no-cache"}
+    raise HTTPError(404)
+
+
+# ---------------- HTTP/1.1 ----------------
+async def _read_request(reader):
+    head = await reader.readuntil(b"\r\n\r\n")  # LimitOverrunError past MAX_HEADER_BYTES
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "bad content-length")
+    if length:
+        await reader.readexactly(length)  # GET-only API: drain and ignore
+    return method.upper(), target, version, headers
+
+
+def _response(status, body, headers, keep_alive, head_only=False):
+    out = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+    headers = dict(headers)
+    if body is not None:
+        headers.setdefault("Content-Type", "application/json; charset=utf-8")
+    headers["Content-Length"] = str(len(body or b""))
+    headers["Connection"] = "keep-alive" if keep_alive else "close"
+    out += [f"{k}: {v}" for k, v in headers.items()]
+    data = ("\r\n".join(out) + "\r\n\r\n").encode("latin-1")
+    return data + (b"" if head_only or body is None else body)
+
+
+async def handle(reader, writer):
+    try:
+        while True:
+            try:
+                method, target, version, headers = await _read_request(reader)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            except HTTPError as e:
+                # malformed request: answer it, then drop the connection (framing is unknown)
+                writer.write(_response(e.status, json.dumps({"error": e.message}).encode("utf-8"), {}, False))
+                await writer.drain()
+                break
+            keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+            try:
+                status, body, extra = await dispatch(method, target, headers)
+            except HTTPError as e:
+                status, body, extra = e.status, json.dumps({"error": e.message}).encode("utf-8"), {}
+            except Exception as e:  # keep serving; the error goes to the client and stderr
+                print(f"api: {method} {target}: {type(e).__name__}: {e}", file=sys.stderr)
+                status, body, extra = 500, b'{"error":"internal error"}', {}
+            writer.write(_response(status, body, extra, keep_alive, method == "HEAD"))
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT):
+    server = await asyncio.start_server(handle, host, port, limit=MAX_HEADER_BYTES)
+    print(f"api listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    db.init_db()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+# backup.py — online backups of clinic.db plus patient_photos/ and uploads/
+# The DB is copied with SQLite's online backup API a few pages at a time, sleeping between
+# steps, so the app's writers are never blocked for the length of the whole copy (a plain
+# file copy of a WAL database is not a consistent backup). Photos/uploads are stored once
+# per content hash; each snapshot only has a manifest pointing at them, and files whose
+# mtime/size didn't change since the last snapshot are not even re-hashed.
+#
+# Layout (HH_BACKUP_DIR):
+#   snapshots/<YYYYmmdd_HHMMSS>/clinic.db        consistent DB copy
+#   snapshots/<YYYYmmdd_HHMMSS>/manifest.json    {relpath: {mtime, size, sha256}}
+#   snapshots/<YYYYmmdd_HHMMSS>/status.json      integrity_check result (written by the verifier)
+#   files/<sha[:2]>/<sha>                        file contents, shared between snapshots
+#
+# Run:
+#   python backup.py                 # one snapshot now (verified in the foreground)
+#   python backup.py --daemon        # snapshot every HH_BACKUP_INTERVAL_MIN minutes
+#   python backup.py --restore-files snapshots/<stamp> DEST   # rebuild photos/uploads from a manifest
+#
+# SQLite only (HH_DB_PATH): with HH_DB_URL set the app doesn't schedule it and the CLI refuses
+# to run; back up PostgreSQL with pg_dump or continuous archiving (PITR) on the DB server.
+#
+# Env:
+#   HH_BACKUP_DIR            where backups go (default backups/)
+#   HH_BACKUP_INTERVAL_MIN   minutes between snapshots for the app/daemon (default 360, 0 = off)
+#   HH_BACKUP_KEEP           snapshots kept (default 14)
+#   HH_BACKUP_PAGES          pages copied per backup step (default 256)
+#   HH_BACKUP_SLEEP_MS       pause between steps (default 20)
+#   HH_BACKUP_DIRS           comma-separated folders to back up (default patient_photos,uploads)
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import db
+
+BACKUP_DIR = Path(os.getenv("HH_BACKUP_DIR", "backups"))
+INTERVAL_MIN = float(os.getenv("HH_BACKUP_INTERVAL_MIN", "360") or 0)
+KEEP = int(os.getenv("HH_BACKUP_KEEP", "14") or 14)
+PAGES = int(os.getenv("HH_BACKUP_PAGES", "256") or 256)
+SLEEP_MS = float(os.getenv("HH_BACKUP_SLEEP_MS", "20") or 0)
+FILE_DIRS = [d.strip() for d in os.getenv("HH_BACKUP_DIRS", "patient_photos,uploads").split(",") if d.strip()]
+LOCK_STALE_S = 3600
+
+
+# ---------------- DB ----------------
+def backup_db(src_path, dest_path, pages=PAGES, sleep_ms=SLEEP_MS):
+    """Online copy of src_path into dest_path, `pages` pages per step -> seconds taken."""
+    t0 = time.perf_counter()
+    tmp = Path(f"{dest_path}.part")
+    tmp.unlink(missing_ok=True)
+
+    def _pause(status, remaining, total):
+        if remaining and sleep_ms:
+            time.sleep(sleep_ms / 1000.0)
+
+    with closing(sqlite3.connect(src_path, timeout=30)) as src, closing(sqlite3.connect(tmp)) as dst:
+        src.backup(dst, pages=pages, progress=_pause)
+        dst.execute("PRAGMA journal_mode=DELETE")  # single self-contained file
+    os.replace(tmp, dest_path)
+    return time.perf_counter() - t0
+
+
+def integrity_check(db_path):
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+        rows = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+    return rows == ["ok"], rows[:20]
+
+
+def verify_snapshot(snap_dir):
+    """Run integrity_check on a snapshot and record the result in its status.json."""
+    snap_dir = Path(snap_dir)
+    t0 = time.perf_counter()
+    try:
+        ok, detail = integrity_check(snap_dir / "clinic.db")
+    except sqlite3.Error as e:
+        ok, detail = False, [f"{type(e).__name__}: {e}"]
+    status = {
+        "integrity": "ok" if ok else "FAILED",
+        "detail": detail,
+        "checked_at": datetime.now().isoformat(timespec="seconds"),
+        "check_s": round(time.perf_counter() - t0, 2),
+    }
+    (snap_dir / "status.json").write_text(json.dumps(status, ensure_ascii=False, indent=2), encoding="utf-8")
+    return ok
+
+
+# ---------------- Files ----------------
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _blob_path(root, sha):
+    return root / "files" / sha[:2] / sha
+
+
+def backup_files(root, dirs, previous=None):
+    """Store new/changed files as content-addressed blobs -> (manifest, files hashed, blobs copied)."""
+    previous = previous or {}
+    manifest, hashed, copied = {}, 0, 0
+    for d in dirs:
+        base = Path(d)
+        if not base.is_dir():
+            continue
+        for p in sorted(base.rglob("*")):
+            if not p.is_file():
+                continue
+            rel = p.as_posix()
+            st = p.stat()
+            old = previous.get(rel)
+            if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+                sha = old["sha256"]
+            else:
+                sha = _sha256(p)
+                hashed += 1
+            blob = _blob_path(root, sha)
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                tmp = Path(f"{blob}.part")
+                shutil.copy2(p, tmp)
+                os.replace(tmp, blob)
+                copied += 1
+            manifest[rel] = {"mtime": st.st_mtime, "size": st.st_size, "sha256": sha}
+    return manifest, hashed, copied
+
+
+def restore_files(root, snap_dir, dest):
+    manifest = json.loads((Path(snap_dir) / "manifest.json").read_text(encoding="utf-8"))
+    for rel, meta in manifest.items():
+        out = Path(dest) / rel
+        out.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(_blob_path(Path(root), meta["sha256"]), out)
+    return len(manifest)
+
+
+# ---------------- Snapshots / retention ----------------
+def list_snapshots(root=BACKUP_DIR):
+    snaps = Path(root) / "snapshots"
+    if not snaps.is_dir():
+        return []
+    return sorted(p for p in snaps.iterdir() if p.is_dir() and (p / "clinic.db").exists())
+
+
+def prune(root=BACKUP_DIR, keep=KEEP):
+    """Drop snapshots beyond `keep` and blobs no remaining manifest refers to -> snapshots removed."""
+    root = Path(root)
+    snaps = list_snapshots(root)
+    old = snaps[:-keep] if keep > 0 else []
+    for s in old:
+        shutil.rmtree(s, ignore_errors=True)
+    referenced = set()
+    for s in snaps[len(old):]:
+        mf = s / "manifest.json"
+        if mf.exists():
+            referenced.update(m["sha256"] for m in json.loads(mf.read_text(encoding="utf-8")).values())
+    files = root / "files"
+    if files.is_dir():
+        for blob in files.glob("*/*"):
+            if blob.name not in referenced:
+                blob.unlink(missing_ok=True)
+    return len(old)
+
+
+class _DirLock:
+    """Cross-process guard so two app processes don't snapshot at the same moment."""
+
+    def __init__(self, root):
+        self.path = Path(root) / ".lock"
+        self.held = False
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if time.time() - self.path.stat().st_mtime > LOCK_STALE_S:
+                self.path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            self.held = True
+        except FileExistsError:
+            self.held = False
+        return self
+
+    def __exit__(self, *exc):
+        if self.held:
+            self.path.unlink(missing_ok=True)
+        return False
+
+
+def snapshot(db_path=None, root=BACKUP_DIR, dirs=FILE_DIRS, keep=KEEP, verify="background"):
+    """Take one snapshot -> summary dict (None if another process is already backing up).
+    verify: "background" (thread), "foreground" or None."""
+    root = Path(root)
+    with _DirLock(root) as lock:
+        if not lock.held:
+            return None
+        snaps = list_snapshots(root)
+        previous = {}
+        if snaps and (snaps[-1] / "manifest.json").exists():
+            previous = json.loads((snaps[-1] / "manifest.json").read_text(encoding="utf-8"))
+        snap = root / "snapshots" / datetime.now().strftime("%Y%m%d_%H%M%S")
+        snap.mkdir(parents=True, exist_ok=True)
+        db_s = backup_db(db_path or db.DB_PATH, snap / "clinic.db")
+        manifest, hashed, copied = backup_files(root, dirs, previous)
+        (snap / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+        removed = prune(root, keep)
+    if verify == "foreground":
+        verify_snapshot(snap)
+    elif verify == "background":
+        threading.Thread(target=verify_snapshot, args=(snap,), name="backup-verify", daemon=True).start()
+    return {"snapshot": str(snap), "db_s": round(db_s, 2), "files": len(manifest),
+            "hashed": hashed, "copied": copied, "pruned": removed}
+
+
+# ---------------- Scheduler ----------------
+class BackupService:
+    """Daemon thread taking a snapshot every interval_min minutes (first one when the last
+    snapshot on disk is already older than the interval)."""
+
+    def __init__(self, interval_min=INTERVAL_MIN, db_path=None, root=BACKUP_DIR):
+        self.interval_s = interval_min * 60.0
+        self.db_path = db_path
+        self.root = Path(root)
+        self.last = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="backup-service", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _first_delay(self):
+        snaps = list_snapshots(self.root)
+        if not snaps:
+            return 0.0
+        age = time.time() - (snaps[-1] / "clinic.db").stat().st_mtime
+        return max(0.0, self.interval_s - age)
+
+    def _run(self):
+        delay = self._first_delay()
+        while not self._stop.wait(delay):
+            try:
+                self.last = snapshot(self.db_path, self.root) or self.last
+            except (OSError, sqlite3.Error) as e:
+                self.last = {"error": f"{type(e).__name__}: {e}", "at": datetime.now().isoformat(timespec="seconds")}
+            delay = self.interval_s
+
+
+def start_service():
+    """Start the scheduled backups for this process (None when HH_BACKUP_INTERVAL_MIN is 0,
+    or on PostgreSQL, where clinic.db is not the live database)."""
+    if INTERVAL_MIN <= 0 or db.DB_URL:
+        return None
+    return BackupService().start()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Online backup of clinic.db and uploaded files")
+    ap.add_argument("--db", default=db.DB_PATH)
+    ap.add_argument("--dir", default=str(BACKUP_DIR), help="backup root")
+    ap.add_argument("--keep", type=int, default=KEEP)
+    ap.add_argument("--daemon", action="store_true", help=f"repeat every {INTERVAL_MIN:g} minutes")
+    ap.add_argument("--restore-files", nargs=2, metavar=("SNAPSHOT", "DEST"), help="rebuild photos/uploads from a snapshot")
+    args = ap.parse_args(argv)
+
+    if args.restore_files:
+        n = restore_files(args.dir, *args.restore_files)
+        print(f"restored {n} files into {args.restore_files[1]}")
+        return 0
+    if db.DB_URL:
+        print("backup.py copies the SQLite file; back up PostgreSQL with pg_dump or PITR", file=sys.stderr)
+        return 2
+    if args.daemon:
+        if INTERVAL_MIN <= 0:
+            print("HH_BACKUP_INTERVAL_MIN is 0; nothing to schedule")
+            return 1
+        svc = BackupService(INTERVAL_MIN, args.db, args.dir).start()
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            svc.stop()
+        return 0
+    res = snapshot(args.db, args.dir, keep=args.keep, verify="foreground")
+    if res is None:
+        print("another backup is running")
+        return 1
+    status = json.loads((Path(res["snapshot"]) / "status.json").read_text(encoding="utf-8"))
+    print(f"{res['snapshot']}: db {res['db_s']}s, {res['files']} files ({res['hashed']} hashed, "
+          f"{res['copied']} copied), {res['pruned']} old snapshot(s) pruned, integrity {status['integrity']}")
+    return 0 if status["integrity"] == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
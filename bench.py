@@ -0,0 +1,143 @@
+# bench.py — repeatable DB-layer benchmarks against a synthetic clinic.db
+# Run:
+#   python bench.py                                  # build /tmp/hh_bench.db if needed and run
+#   python bench.py --save bench_baseline.json       # store a baseline
+#   python bench.py --compare bench_baseline.json    # exit 1 if a median regressed > --threshold %
+#
+# The DB is generated by synth_data.py with a fixed seed, so numbers are comparable between
+# runs on the same machine as long as --patients/--days stay the same (they are stored in
+# the baseline and checked on --compare).
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import db
+import print_utils
+import queries
+import synth_data
+
+
+def _no_logo():
+    return None
+
+
+def _age(dob):
+    return dob or "-"
+
+
+def build_cases(pid, day):
+    """name -> zero-arg callable. Every case goes through db.run_query like the app does."""
+    rq = db.run_query
+    iso = day.isoformat()
+    return {
+        "run_query.patient_by_id": lambda: rq("SELECT * FROM patients WHERE id=?", (pid,), fetch=True),
+        "prefill.nurse": lambda: queries.fetch_nurse_prefill(rq, pid, day),
+        "prefill.physio_basic": lambda: queries.fetch_physio_prefill(rq, pid, iso, "basic"),
+        "prefill.physio_rehab": lambda: queries.fetch_physio_prefill(rq, pid, iso, "rehab"),
+        "search.patients": lambda: queries.search_patients(rq, "สม"),
+        "meds.active_summary": lambda: queries.active_meds_summary(rq, pid),
+        "meds.pick_list": lambda: queries.pharmacy_pick_list(rq, "เช้า"),
+        "print.patient_inputlike": lambda: print_utils.build_patient_inputlike_print_html(rq, _no_logo, _age, pid),
+        "print.vitals_inputlike": lambda: print_utils.build_vitals_inputlike_print_html(rq, _no_logo, _age, pid, iso),
+        "print.physio_inputlike": lambda: print_utils.build_physio_inputlike_print_html(rq, _no_logo, _age, pid, iso),
+        "print.meds": lambda: print_utils.build_meds_print_html(rq, _no_logo, _age, pid, iso),
+        "print.vitals_legacy": lambda: print_utils.build_vitals_print_html(rq, _no_logo, _age, pid, iso),
+        "print.physio_legacy": lambda: print_utils.build_physio_print_html(rq, _no_logo, _age, pid, iso),
+    }
+
+
+def measure(fn, repeat):
+    fn()  # warm the page cache / statement cache
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def prepare_db(db_path, patients, days, rebuild=False):
+    """(Re)generate the synthetic DB unless it matches patients/days, point db at it -> meta."""
+    meta = {"patients": patients, "days": days, "seed": 1}
+    path = Path(db_path)
+    meta_path = path.with_suffix(".meta.json")
+    stale = not path.exists() or not meta_path.exists() or json.loads(meta_path.read_text()) != meta
+    if rebuild or stale:
+        for p in (path, Path(f"{path}-wal"), Path(f"{path}-shm")):
+            p.unlink(missing_ok=True)
+        t0 = time.perf_counter()
+        synth_data.generate(str(path), patients, days, seed=1, end=date(2025, 1, 31), legacy=True)
+        meta_path.write_text(json.dumps(meta))
+        print(f"generated {path} in {time.perf_counter() - t0:.1f}s")
+    db.DB_PATH = str(path)
+    db.init_db()  # apply migrations added since the file was generated
+    return meta
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the DB layer on a synthetic clinic.db")
+    ap.add_argument("--db", default="/tmp/hh_bench.db")
+    ap.add_argument("--patients", type=int, default=200)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--rebuild", action="store_true", help="regenerate the synthetic DB")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("-k", dest="only", default="", help="run only cases whose name contains this")
+    ap.add_argument("--save", help="write results as a baseline JSON file")
+    ap.add_argument("--compare", help="compare medians with a baseline JSON file")
+    ap.add_argument("--threshold", type=float, default=20.0, help="allowed median regression in %% for --compare")
+    args = ap.parse_args(argv)
+
+    meta = prepare_db(args.db, args.patients, args.days, args.rebuild)
+
+    pid = db.run_query("SELECT id FROM patients ORDER BY id LIMIT 1 OFFSET ?", (args.patients // 2,), fetch=True)[0]["id"]
+    day = date(2025, 1, 31) - timedelta(days=1)
+    results = {}
+    for name, fn in build_cases(pid, day).items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(fn, args.repeat)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    if baseline and baseline.get("meta", {}).get("data") != meta:
+        print(f"warning: baseline was taken with {baseline.get('meta', {}).get('data')}, now {meta}")
+    regressions = []
+    print(f"{'case':32} {'min':>9} {'median':>9} {'p95':>9}" + ("  vs baseline" if baseline else ""))
+    for name, r in results.items():
+        line = f"{name:32} {r['min_ms']:9.3f} {r['median_ms']:9.3f} {r['p95_ms']:9.3f}"
+        base = (baseline or {}).get("results", {}).get(name)
+        if base:
+            delta = (r["median_ms"] - base["median_ms"]) / max(base["median_ms"], 1e-9) * 100.0
+            line += f"  {delta:+7.1f}%"
+            if delta > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps({
+            "meta": {
+                "data": meta, "repeat": args.repeat, "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version, "machine": platform.machine(),
+            },
+            "results": results,
+        }, indent=2))
+        print(f"baseline written to {args.save}")
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0f}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# bulk_import.py — bulk import of historical paper charts into nurse_logs / physio_logs
+# Run:
+#   python bulk_import.py charts_2023.csv                 # kind detected from the header
+#   python bulk_import.py physio.xlsx --kind physio --batch-size 20000
+#
+# One row per (patient, date, shift/physio type, field):
+#   nurse : hn, date, shift, section, field, value [, time, created_by]
+#   physio: hn, date, physio_type, section, field, value [, created_by]
+# - date accepts the same formats as the patient form (YYYY-MM-DD / yyyymmdd / ddmmyyyy)
+# - shift accepts day/night or กลางวัน/กลางคืน; physio_type accepts basic/rehab or the Thai labels
+# - section/field must match the labels in form_defs.py exactly
+# Rejected rows are written next to the input as <name>.rejects.csv with a reason column.
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import db
+import labels
+from form_defs import SHIFT_ALIASES, PHYSIO_TYPE_ALIASES, nurse_labels, physio_labels
+
+NURSE_COLUMNS = ("hn", "date", "shift", "section", "field", "value")
+PHYSIO_COLUMNS = ("hn", "date", "physio_type", "section", "field", "value")
+# Default clock time for nurse rows without a time column (start of the shift)
+SHIFT_DEFAULT_TIME = {"day": "07:00", "night": "19:00"}
+
+
+def _norm_date(s):
+    s = (s or "").strip()
+    if not s:
+        return None
+    if len(s) == 8 and s.isdigit():
+        if int(s[:2]) > 31:
+            y, m, d = s[:4], s[4:6], s[6:8]
+        else:
+            d, m, y = s[:2], s[2:4], s[4:8]
+        s = f"{y}-{m}-{d}"
+    try:
+        return datetime.strptime(s[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _norm_time(s, default):
+    s = (s or "").strip()
+    if not s:
+        return default
+    try:
+        return datetime.strptime(s[:5], "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return None
+
+
+def iter_rows(path):
+    """Yield dict rows (lower-cased headers) from a CSV or XLSX file without loading it whole."""
+    path = Path(path)
+    if path.suffix.lower() in (".xlsx", ".xlsm"):
+        try:
+            import openpyxl
+        except ImportError:
+            raise SystemExit("XLSX import requires openpyxl (pip install openpyxl)")
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            it = wb.active.iter_rows(values_only=True)
+            header = [str(h or "").strip().lower() for h in next(it, ())]
+            for values in it:
+                if not any(v not in (None, "") for v in values):
+                    continue
+                yield {h: ("" if v is None else str(v)) for h, v in zip(header, values)}
+        finally:
+            wb.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [(h or "").strip().lower() for h in (reader.fieldnames or [])]
+            yield from reader
+
+
+def load_hn_map(conn):
+    """HN -> patients.id, loaded once per import."""
+    return {r[0].strip(): r[1] for r in conn.execute("SELECT hn, id FROM patients WHERE hn IS NOT NULL")}
+
+
+class Importer:
+    def __init__(self, conn, kind, created_by="bulk_import", batch_size=10_000):
+        self.conn = conn
+        self.kind = kind
+        self.created_by = created_by
+        self.batch_size = batch_size
+        self.hn_map = load_hn_map(conn)
+        self.labels = nurse_labels() if kind == "nurse" else physio_labels()
+        self._rq = labels.conn_query(conn)
+        self._ids = labels.LabelDict().load(self._rq)
+        self.inserted = 0
+        self.rejects = []
+        self._batch = []
+
+    def _convert(self, r):
+        """Return (params, None) for a valid row or (None, reason)."""
+        hn = (r.get("hn") or "").strip()
+        pid = self.hn_map.get(hn)
+        if pid is None:
+            return None, f"unknown HN '{hn}'"
+        day = _norm_date(r.get("date"))
+        if not day:
+            return None, f"bad date '{r.get('date')}'"
+        section = (r.get("section") or "").strip()
+        field = (r.get("field") or "").strip()
+        value = (r.get("value") or "").strip()
+        if not value:
+            return None, "empty value"
+        who = (r.get("created_by") or "").strip() or self.created_by
+        if self.kind == "nurse":
+            shift = SHIFT_ALIASES.get((r.get("shift") or "").strip().lower())
+            if not shift:
+                return None, f"bad shift '{r.get('shift')}'"
+            if (shift, section, field) not in self.labels:
+                return None, f"unknown label '{section}' / '{field}' for {shift}"
+            t = _norm_time(r.get("time"), SHIFT_DEFAULT_TIME[shift])
+            if not t:
+                return None, f"bad time '{r.get('time')}'"
+            # the chart date is the care day, night hours after midnight included (shift_helpers)
+            return (pid, hn, f"{day} {t}", shift, self._id(section), self._id(field), value, self._id(who), day), None
+        ptype = PHYSIO_TYPE_ALIASES.get((r.get("physio_type") or "").strip().lower())
+        if not ptype:
+            return None, f"bad physio_type '{r.get('physio_type')}'"
+        if (ptype, section, field) not in self.labels:
+            return None, f"unknown label '{section}' / '{field}' for {ptype}"
+        return (pid, day, ptype, self._id(section), self._id(field), value, self._id(who)), None
+
+    def _id(self, label):
+        return self._ids.id(self._rq, label)
+
+    def _flush(self):
+        if not self._batch:
+            return
+        if self.kind == "nurse":
+            sql = ("INSERT INTO nurse_logs (patient_id, hn, ts, shift, section, field, section_id, field_id, value, "
+                   "created_by_id, care_day) VALUES (?,?,?,?,'','',?,?,?,?,?)")
+        else:
+            sql = ("INSERT INTO physio_logs (patient_id, log_date, physio_type, section, field, section_id, field_id, "
+                   "value, created_by_id) VALUES (?,?,?,'','',?,?,?,?)")
+        with self.conn:  # one transaction per batch
+            self.conn.executemany(sql, self._batch)
+        self.inserted += len(self._batch)
+        self._batch = []
+
+    def feed(self, line_no, r):
+        params, reason = self._convert(r)
+        if reason:
+            self.rejects.append((line_no, reason, r))
+            return
+        self._batch.append(params)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def finish(self):
+        self._flush()
+
+
+def detect_kind(path):
+    first = next(iter_rows(path), None) or {}
+    return "physio" if "physio_type" in first else "nurse"
+
+
+def write_rejects(path, rejects):
+    out = Path(path).with_suffix(".rejects.csv")
+    keys = []
+    for _, _, r in rejects:
+        keys += [k for k in r if k not in keys]
+    with open(out, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(["line", "reason"] + keys)
+        for line_no, reason, r in rejects:
+            w.writerow([line_no, reason] + [r.get(k, "") for k in keys])
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bulk import nurse/physio chart rows from CSV/XLSX")
+    ap.add_argument("path")
+    ap.add_argument("--kind", choices=["nurse", "physio", "auto"], default="auto")
+    ap.add_argument("--db", default=db.DB_PATH)
+    ap.add_argument("--batch-size", type=int, default=10_000, help="rows per executemany/transaction")
+    ap.add_argument("--created-by", default="bulk_import", help="author when the file has no created_by column")
+    args = ap.parse_args(argv)
+
+    kind = detect_kind(args.path) if args.kind == "auto" else args.kind
+    required = NURSE_COLUMNS if kind == "nurse" else PHYSIO_COLUMNS
+    first = next(iter_rows(args.path), None)
+    if first is None:
+        print("ไฟล์ว่าง (no rows)")
+        return 1
+    missing = [c for c in required if c not in first]
+    if missing:
+        print(f"missing columns for {kind}: {', '.join(missing)}")
+        return 1
+
+    db.init_db(args.db)
+    t0 = time.perf_counter()
+    with closing(sqlite3.connect(args.db)) as conn:
+        conn.execute("PRAGMA synchronous=NORMAL")
+        imp = Importer(conn, kind, created_by=args.created_by, batch_size=max(1, args.batch_size))
+        total = 0
+        for i, r in enumerate(iter_rows(args.path), start=2):  # line 1 is the header
+            total += 1
+            imp.feed(i, r)
+        imp.finish()
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+
+    print(f"{kind}: read {total} rows, inserted {imp.inserted}, rejected {len(imp.rejects)} "
+          f"in {elapsed:.2f}s ({imp.inserted / elapsed:,.0f} rows/s)")
+    if imp.rejects:
+        out = write_rejects(args.path, imp.rejects)
+        reasons = {}
+        for _, reason, _ in imp.rejects:
+            key = reason.split(" '")[0]
+            reasons[key] = reasons.get(key, 0) + 1
+        for reason, n in sorted(reasons.items(), key=lambda kv: -kv[1]):
+            print(f"  {n:>8}  {reason}")
+        print(f"rejects written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
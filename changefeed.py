@@ -0,0 +1,133 @@
+# changefeed.py — incremental change feed over nurse_logs / physio_logs / medications
+# Triggers (db.init_db / storage.PG_SCHEMA) append one change_log row per inserted, updated
+# or deleted row. A consumer keeps the last change id it processed and asks for what came
+# after it, so a sync costs O(changes) instead of a rescan of the tables.
+#
+# Run:
+#   python changefeed.py --out changes.jsonl                 # everything after the saved cursor, then exit
+#   python changefeed.py --out changes.jsonl --follow        # keep tailing every --interval seconds
+#   python changefeed.py --out - --cursor 0 --limit 100      # first 100 changes to stdout
+#   python changefeed.py --prune-days 90                     # drop feed entries older than 90 days
+#
+# Each JSONL line: {"id", "tbl", "op", "row_id", "patient_id", "at", "row"}; row is the
+# current content of the changed row (null once it's deleted or archived).
+# op: I insert, U update, D delete, A archived -- a superseded nurse/physio version that
+# compact_logs.py moved to log_archive; the newer version of that field is still live, so a
+# consumer that mirrors only current values can drop the row, one that keeps history shouldn't. The cursor is written to
+# --cursor-file only after the lines are flushed, so a crash re-sends rather than skips.
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import labels
+
+FEED_TABLES = ("nurse_logs", "physio_logs", "medications")
+
+
+def changes_since(run_query, cursor=0, limit=500, tables=None, with_rows=True):
+    """Changes with id > cursor, oldest first -> (changes, next cursor)."""
+    tables = [t for t in (tables or FEED_TABLES) if t in FEED_TABLES]
+    if not tables:
+        return [], cursor
+    changes = run_query(
+        f"""
+        SELECT id, tbl, op, row_id, patient_id, at FROM change_log
+        WHERE id > ? AND tbl IN ({','.join('?' * len(tables))})
+        ORDER BY id LIMIT ?
+        """,
+        (cursor, *tables, limit), fetch=True
+    ) or []
+    if with_rows and changes:
+        # one IN (...) lookup per table for the whole page
+        wanted = {}
+        for c in changes:
+            wanted.setdefault(c["tbl"], set()).add(c["row_id"])
+        current = {}
+        for tbl, ids in wanted.items():
+            ids = sorted(ids)
+            rows = run_query(
+                f"SELECT * FROM {tbl} WHERE id IN ({','.join('?' * len(ids))})", ids, fetch=True
+            ) or []
+            if tbl != "medications":
+                labels.decode(run_query, rows)  # consumers keep getting section / field text
+            for r in rows:
+                current[(tbl, r["id"])] = r
+        for c in changes:
+            c["row"] = current.get((c["tbl"], c["row_id"]))
+    return changes, (changes[-1]["id"] if changes else cursor)
+
+
+def prune(run_query, days):
+    """Delete feed entries older than `days` days (consumers must have read them by then)."""
+    before = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    run_query("DELETE FROM change_log WHERE at < ?", (before,))
+
+
+def _read_cursor(path):
+    try:
+        return int(Path(path).read_text().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_cursor(path, cursor):
+    tmp = f"{path}.tmp"
+    Path(tmp).write_text(str(cursor))
+    os.replace(tmp, path)
+
+
+def tail(run_query, out, cursor, cursor_file=None, limit=500, follow=False, interval=2.0, tables=None):
+    """Write changes after `cursor` to the file object `out` -> last cursor written."""
+    while True:
+        changes, nxt = changes_since(run_query, cursor, limit, tables)
+        for c in changes:
+            out.write(json.dumps(c, ensure_ascii=False, default=str) + "\n")
+        if changes:
+            out.flush()
+            cursor = nxt
+            if cursor_file:
+                _write_cursor(cursor_file, cursor)
+        if len(changes) < limit:
+            if not follow:
+                return cursor
+            time.sleep(interval)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Tail the clinic change feed to JSONL")
+    ap.add_argument("--out", default="-", help="JSONL file to append to ('-' = stdout)")
+    ap.add_argument("--cursor", type=int, help="start after this change id (default: --cursor-file)")
+    ap.add_argument("--cursor-file", default=".changefeed.cursor")
+    ap.add_argument("--limit", type=int, default=500, help="changes per query")
+    ap.add_argument("--tables", default="", help=f"comma-separated subset of {','.join(FEED_TABLES)}")
+    ap.add_argument("--follow", action="store_true")
+    ap.add_argument("--interval", type=float, default=2.0, help="seconds between polls with --follow")
+    ap.add_argument("--prune-days", type=int, help="delete entries older than this many days and exit")
+    args = ap.parse_args(argv)
+
+    import db
+    db.init_db()
+    if args.prune_days is not None:
+        prune(db.run_query, args.prune_days)
+        return 0
+    cursor = args.cursor if args.cursor is not None else _read_cursor(args.cursor_file)
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()] or None
+    out = sys.stdout if args.out == "-" else open(args.out, "a", encoding="utf-8")
+    try:
+        cursor = tail(db.run_query, out, cursor, args.cursor_file if args.out != "-" else None,
+                      args.limit, args.follow, args.interval, tables)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"cursor {cursor}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# check_startup.py — cold-start budget for app.py, measured with `python -X importtime`
+# Run:
+#   python check_startup.py                        # best of 3 fresh interpreters, exit 1 if over budget
+#   python check_startup.py --budget-ms 800 --top 25
+#
+# Each run imports app.py in a new interpreter (Streamlit "bare mode": the script body runs,
+# main() doesn't), against a throwaway DB in a temp dir, so it measures module imports plus
+# the one-time _bootstrap() a fresh server process pays before its first render.
+# It also fails if a module that app.py should only import on first use (--lazy) shows up.
+#
+# Env:
+#   HH_STARTUP_BUDGET_MS   default for --budget-ms (1500)
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+LAZY = ("pandas", "print_utils", "remember_login")
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_times(module="app", extra_env=None):
+    """One fresh `python -X importtime -c "import <module>"` -> [(name, self_us, cumulative_us, depth)]."""
+    with tempfile.TemporaryDirectory(prefix="hh_startup_") as tmp:
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": os.pathsep.join(p for p in (str(HERE), env.get("PYTHONPATH")) if p),
+            "HH_DB_PATH": str(Path(tmp) / "startup.db"),
+            "HH_BACKUP_INTERVAL_MIN": "0",
+            "HH_METRICS_FILE": "",
+            "HH_SLOW_QUERY_LOG": "",
+        })
+        env.update(extra_env or {})
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=tmp, env=env, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fail if importing app.py takes longer than the startup budget")
+    ap.add_argument("--module", default="app")
+    ap.add_argument("--budget-ms", type=float, default=float(os.getenv("HH_STARTUP_BUDGET_MS", "1500") or 1500))
+    ap.add_argument("--runs", type=int, default=3, help="fresh interpreters; the fastest one is judged")
+    ap.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    ap.add_argument("--lazy", default=",".join(LAZY), help="modules that must not be imported at startup")
+    args = ap.parse_args(argv)
+
+    best = None
+    for _ in range(max(1, args.runs)):
+        rows = import_times(args.module)
+        total = next((cum for name, _s, cum, depth in rows if name == args.module and depth == 0), 0)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+    total_ms = total / 1000.0
+
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})")
+    print(f"{'self ms':>9} {'cum ms':>9}  module")
+    for name, self_us, cum_us, depth in sorted(rows, key=lambda r: -r[1])[:args.top]:
+        print(f"{self_us / 1000:9.1f} {cum_us / 1000:9.1f}  {name}")
+
+    loaded = {name for name, *_ in rows}
+    eager = [m.strip() for m in args.lazy.split(",") if m.strip() in loaded]
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup, should be imported on first use: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: startup {total_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
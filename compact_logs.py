@@ -0,0 +1,228 @@
+# compact_logs.py — move superseded nurse_logs / physio_logs rows into log_archive
+# Every save appends, so a (patient, day, shift, section, field) key collects old versions
+# that every "latest value" read has to skip. This keeps the latest row per key in the hot
+# table and moves the older ones, complete, into log_archive (zlib'd JSON, one blob per
+# table/patient/day and run), so the audit trail survives and can be read back with --show.
+#
+# Work is done one day at a time, one short BEGIN IMMEDIATE transaction per table and day,
+# with a pause in between, so the app's writers wait milliseconds rather than the whole run.
+# The run ends with PRAGMA incremental_vacuum in small steps to give the freed pages back.
+#
+# Run:
+#   python compact_logs.py                    # days up to --keep-days ago, from the last compacted day
+#   python compact_logs.py --dry-run          # only count what would move
+#   python compact_logs.py --full             # rescan from the first day (e.g. after a bulk import)
+#   python compact_logs.py --show HN0001 --day 2025-01-31   # archived versions, newest first
+#   python compact_logs.py --enable-incremental             # one-time VACUUM of an older clinic.db (exclusive lock)
+#
+# SQLite only (HH_DB_PATH); on PostgreSQL autovacuum already reclaims the space.
+# Archived rows show up as 'A' entries in the change feed (changefeed.py), not as 'D'.
+#
+# Env:
+#   HH_COMPACT_KEEP_DAYS     care days younger than this are left alone (default 2)
+#   HH_COMPACT_PAUSE_MS      pause between transactions (default 50)
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from contextlib import closing
+from datetime import date, timedelta
+
+import db
+import db_writer
+import labels
+from shift_helpers import care_day
+
+KEEP_DAYS = int(os.getenv("HH_COMPACT_KEEP_DAYS", "2") or 2)
+PAUSE_MS = float(os.getenv("HH_COMPACT_PAUSE_MS", "50") or 0)
+LOOKBACK_DAYS = 7
+VACUUM_PAGES = 2000
+
+# table -> (day column, key columns after patient_id/day, newest-first order)
+# "latest" is the row the prefill queries return (queries.fetch_nurse_prefill / fetch_physio_latest)
+SPECS = {
+    "nurse_logs": ("care_day", ("shift", "section_id", "field_id"), "id DESC"),
+    "physio_logs": ("log_date", ("physio_type", "section_id", "field_id"), "id DESC"),
+}
+
+
+def superseded(conn, tbl, day):
+    """Rows of `day` that a newer row with the same key hides -> list of dicts."""
+    day_col, key, order = SPECS[tbl]
+    # patient_id IN (...) + day = lets idx_nurse_logs_care_day / idx_physio_logs_day serve it
+    cur = conn.execute(
+        f"""
+        SELECT * FROM (
+            SELECT t.*, ROW_NUMBER() OVER (PARTITION BY patient_id, {', '.join(key)} ORDER BY {order}) AS rn
+            FROM {tbl} t
+            WHERE patient_id IN (SELECT id FROM patients) AND {day_col}=?
+        ) WHERE rn > 1
+        """,
+        (day,),
+    )
+    cols = [d[0] for d in cur.description]
+    return [{c: v for c, v in zip(cols, r) if c != "rn"} for r in cur.fetchall()]
+
+
+def compact_day(conn, tbl, day, dry_run=False):
+    """Move one day's superseded rows of tbl into log_archive in one transaction -> rows moved."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = superseded(conn, tbl, day)
+        if rows and not dry_run:
+            # archived rows are self-contained: label text, not ids into label_dict
+            rq = labels.conn_query(conn)
+            labels.LabelDict().load(rq).decode(rq, rows)
+            by_patient = {}
+            for r in rows:
+                by_patient.setdefault(r["patient_id"], []).append(r)
+            conn.executemany(
+                "INSERT INTO log_archive (tbl, patient_id, day, n_rows, rows_z) VALUES (?,?,?,?,?)",
+                [
+                    (tbl, pid, day, len(rs),
+                     zlib.compress(json.dumps(rs, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9))
+                    for pid, rs in by_patient.items()
+                ],
+            )
+            ids = [r["id"] for r in rows]
+            mark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                conn.execute(f"DELETE FROM {tbl} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            # the delete triggers logged 'D'; these rows were archived, not deleted
+            # (BEGIN IMMEDIATE: every change_log row after the mark is one of ours)
+            conn.execute("UPDATE change_log SET op='A' WHERE id > ? AND tbl=? AND op='D'", (mark, tbl))
+        conn.execute("ROLLBACK" if dry_run else "COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def _days(conn, tbl, full, until):
+    """Days to scan: from the last compacted day (minus a lookback for late edits) or the first day."""
+    day_col = SPECS[tbl][0]
+    start = None
+    if not full:
+        start = conn.execute("SELECT MAX(day) FROM log_archive WHERE tbl=?", (tbl,)).fetchone()[0]
+        if start:
+            start = (date.fromisoformat(start) - timedelta(days=LOOKBACK_DAYS)).isoformat()
+    if not start:
+        start = conn.execute(f"SELECT MIN({day_col}) FROM {tbl}").fetchone()[0]
+    if not start:
+        return []
+    d, end = date.fromisoformat(start[:10]), date.fromisoformat(until)
+    out = []
+    while d <= end:
+        out.append(d.isoformat())
+        d += timedelta(days=1)
+    return out
+
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES, pause_ms=PAUSE_MS):
+    """Give free pages back to the OS a chunk at a time -> pages freed (0 unless auto_vacuum=INCREMENTAL)."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not before:
+            return freed
+        conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        freed += before - after
+        if after >= before:
+            return freed
+        if pause_ms:
+            time.sleep(pause_ms / 1000.0)
+
+
+def compact(db_path, keep_days=KEEP_DAYS, full=False, dry_run=False, pause_ms=PAUSE_MS, log=print):
+    """Compact both log tables up to keep_days before the current care day -> {table: rows moved}."""
+    until = (care_day() - timedelta(days=keep_days)).isoformat()
+    moved = {}
+    with closing(sqlite3.connect(db_path, timeout=db_writer.BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)) as conn:
+        conn.execute(f"PRAGMA busy_timeout={db_writer.BUSY_TIMEOUT_MS}")
+        for tbl in SPECS:
+            moved[tbl] = 0
+            for day in _days(conn, tbl, full, until):
+                n = compact_day(conn, tbl, day, dry_run)
+                if n:
+                    moved[tbl] += n
+                    log(f"{tbl} {day}: {n} superseded rows {'would move' if dry_run else 'archived'}")
+                if pause_ms:
+                    time.sleep(pause_ms / 1000.0)
+        if not dry_run:
+            freed = incremental_vacuum(conn, pause_ms=pause_ms)
+            if freed:
+                log(f"incremental_vacuum: {freed} pages freed")
+            elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                log("auto_vacuum is not INCREMENTAL: run --enable-incremental once to reclaim space")
+    return moved
+
+
+def archived_rows(run_query, tbl, patient_id, day=None):
+    """Archived versions of a patient's rows (optionally one day), newest first."""
+    blobs = run_query(
+        "SELECT rows_z FROM log_archive WHERE patient_id=? AND tbl=?" + (" AND day=?" if day else ""),
+        (patient_id, tbl, day) if day else (patient_id, tbl), fetch=True
+    ) or []
+    rows = [r for b in blobs for r in json.loads(zlib.decompress(bytes(b["rows_z"])).decode("utf-8"))]
+    if tbl == "nurse_logs":
+        rows.sort(key=lambda r: (r.get("ts") or "", r["id"]), reverse=True)
+    else:
+        rows.sort(key=lambda r: r["id"], reverse=True)
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Archive superseded nurse_logs / physio_logs rows")
+    ap.add_argument("--db", default=db.DB_PATH)
+    ap.add_argument("--keep-days", type=int, default=KEEP_DAYS)
+    ap.add_argument("--full", action="store_true", help="scan from the first day, not the last compacted one")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--pause-ms", type=float, default=PAUSE_MS)
+    ap.add_argument("--enable-incremental", action="store_true",
+                    help="switch an existing DB to auto_vacuum=INCREMENTAL (full VACUUM, stop the app first)")
+    ap.add_argument("--show", metavar="HN", help="print archived versions for a patient and exit")
+    ap.add_argument("--day", help="with --show: only this day")
+    ap.add_argument("--table", default="nurse_logs", choices=sorted(SPECS), help="with --show")
+    args = ap.parse_args(argv)
+
+    if db.DB_URL:
+        print("compact_logs.py works on the SQLite file; PostgreSQL reclaims space with autovacuum", file=sys.stderr)
+        return 2
+    db.DB_PATH = args.db
+    db.init_db(args.db)
+    if args.show:
+        pid = db.run_query("SELECT id FROM patients WHERE hn=?", (args.show,), fetch=True)
+        if not pid:
+            print(f"no patient with HN {args.show}", file=sys.stderr)
+            return 1
+        for r in archived_rows(db.run_query, args.table, pid[0]["id"], args.day):
+            print(json.dumps(r, ensure_ascii=False))
+        return 0
+    if args.enable_incremental:
+        with closing(sqlite3.connect(args.db, isolation_level=None)) as conn:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        print("auto_vacuum=INCREMENTAL")
+        return 0
+
+    lab = labels.for_query(db.run_query)
+    if any(lab.has_text_rows(db.run_query, t) for t in SPECS):
+        # superseded() keys on the label ids; rows still holding the text would all look like one field
+        print("some log rows still store label text: run `python labels.py --migrate` first", file=sys.stderr)
+        return 2
+    t0 = time.perf_counter()
+    moved = compact(args.db, args.keep_days, args.full, args.dry_run, args.pause_ms)
+    print(", ".join(f"{t}: {n} rows" for t, n in moved.items()) + f" in {time.perf_counter() - t0:.1f}s"
+          + (" (dry run)" if args.dry_run else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,529 @@
+# db.py — database helpers shared by app.py and the offline tools
+# The Streamlit app and the CLI scripts (bulk import, ...) both go through here,
+# so the schema lives in one place and importing it never touches Streamlit.
+# The storage backend (SQLite file or PostgreSQL via HH_DB_URL) lives in storage.py.
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+import db_writer
+import labels
+import query_stats
+import storage
+from drug_catalog import normalize as normalize_drug_name
+from form_defs import SNAPSHOT_VITALS
+
+DB_PATH = os.getenv("HH_DB_PATH", "clinic.db")
+DB_URL = os.getenv("HH_DB_URL", "").strip()
+
+# catch with `except db.IntegrityError` (a tuple: whichever backend raised it)
+IntegrityError = (sqlite3.IntegrityError,)
+if DB_URL:
+    import psycopg2
+    IntegrityError += (psycopg2.IntegrityError,)
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _snapshot_vital(col, key, numeric):
+    """Generated column of form_snapshots: a vital of the payload (whichever shift it is)."""
+    v = f"COALESCE(json_extract(payload, '$.{key}_d'), json_extract(payload, '$.{key}_n'))"
+    if numeric:  # '37.5' / '37.5 C' -> 37.5, anything not starting with a digit -> NULL
+        return f"{col} REAL GENERATED ALWAYS AS (CASE WHEN {v} GLOB '[0-9]*' THEN CAST({v} AS REAL) END) VIRTUAL"
+    return f"{col} TEXT GENERATED ALWAYS AS (NULLIF({v}, '')) VIRTUAL"
+
+
+_SNAPSHOT_VITAL_COLS = ",\n    ".join(_snapshot_vital(*v) for v in SNAPSHOT_VITALS)
+
+
+# one row per saved nurse shift / physio type (queries.save_form_snapshot): the whole form
+# section as JSON, next to the EAV rows in nurse_logs / physio_logs
+FORM_SNAPSHOTS_SQL = f"""
+CREATE TABLE IF NOT EXISTS form_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER NOT NULL,
+    form TEXT NOT NULL,             -- 'nurse' | 'physio'
+    day TEXT NOT NULL,              -- nurse care_day / physio log_date
+    kind TEXT NOT NULL,             -- shift ('day' | 'night') / physio_type
+    payload TEXT NOT NULL,          -- JSON {{widget key: value}} of the non-empty fields after the save
+    log_id INTEGER,                 -- newest nurse_logs / physio_logs id the payload includes
+    created_by_id INTEGER,          -- label_dict id
+    ts TEXT,
+    created_at TEXT DEFAULT (datetime('now')),
+    {_SNAPSHOT_VITAL_COLS}
+);
+-- latest snapshot per (patient, form, day, kind); the vitals columns make trend reads index-only
+CREATE INDEX IF NOT EXISTS idx_form_snapshots_day ON form_snapshots(
+    patient_id, form, day, kind, id, ts, {", ".join(col for col, _, _ in SNAPSHOT_VITALS)});
+"""
+
+
+def get_backend():
+    """Backend for HH_DB_URL, else the SQLite file at DB_PATH (tools may reassign DB_PATH)."""
+    key = DB_URL or DB_PATH
+    b = _backends.get(key)
+    if b is None:
+        with _backends_lock:
+            b = _backends.get(key)
+            if b is None:
+                b = _backends[key] = storage.open_backend(key)
+    return b
+
+
+def set_backend(backend):
+    """Point run_query at an already opened backend (storage.py --smoke)."""
+    global DB_URL, DB_PATH
+    if backend.dialect == "sqlite":
+        DB_URL, DB_PATH = "", backend.path
+    else:
+        DB_URL = backend.url
+    _backends[DB_URL or DB_PATH] = backend
+    labels.reset()
+
+
+def connect(db_path=None):
+    conn = sqlite3.connect(db_path or DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def utcnow():
+    """'YYYY-MM-DD HH:MM:SS' in UTC, the format of the created_at defaults (both backends)."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def run_transaction(fn):
+    """fn(run_query) as one transaction: the statements fn runs through the run_query it is
+    given commit together or not at all -> fn's return value. On SQLite this is a single
+    db_writer submission, so fn must use that run_query, never the module-level one.
+    Resolve new labels (labels.id) before: the label map is shared with run_query."""
+    def _bound(rq):
+        rq.labels_of = run_query  # labels.for_query: run_query's map, not a new one per call
+        return fn(rq)
+
+    backend = get_backend()
+    if db_writer.ENABLED and backend.dialect == "sqlite":
+        return db_writer.get_writer(backend.path).call(lambda conn: _bound(storage.sqlite_query(conn)))
+    return backend.transaction(_bound)
+
+
+def columns(table):
+    return get_backend().columns(table)
+
+
+def run_query(sql, params=(), fetch=False, many=False):
+    """fetch=True -> list of dict rows; otherwise commits and returns the lastrowid.
+    SQLite writes go through the db_writer thread (group commit) unless HH_DB_WRITER=0."""
+    t0 = time.perf_counter()
+    rows, error = None, None
+    backend = get_backend()
+    try:
+        if not fetch and db_writer.ENABLED and backend.dialect == "sqlite":
+            lastrowid, rows = db_writer.write(backend.path, sql, params, many)
+            return lastrowid
+        out = backend.execute(sql, params, fetch, many)
+        if fetch:
+            rows = len(out)
+            return out
+        lastrowid, rows = out
+        return lastrowid
+    except backend.Error as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        query_stats.record(getattr(backend, "path", None), sql, params, many, rows,
+                           (time.perf_counter() - t0) * 1000.0, error)
+
+
+def iter_query(sql, params=(), size=500):
+    """Generator over the dict rows of a SELECT, fetched `size` at a time, so memory stays flat
+    however many rows match (date-range reports). Keep the loop body short: the read stays open
+    until the generator is exhausted or closed."""
+    t0 = time.perf_counter()
+    n, error = 0, None
+    backend = get_backend()
+    try:
+        for r in backend.iter_rows(sql, params, size):
+            n += 1
+            yield r
+    except backend.Error as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        query_stats.record(getattr(backend, "path", None), sql, params, False, n,
+                           (time.perf_counter() - t0) * 1000.0, error)
+
+
+def init_db(db_path=None):
+    if db_path is None and DB_URL:
+        get_backend().init_schema()
+        return
+    with closing(sqlite3.connect(db_path or DB_PATH)) as conn:
+        c = conn.cursor()
+        c.executescript("""
+        PRAGMA auto_vacuum=INCREMENTAL;  -- only takes effect on a new file (compact_logs.py reclaims pages)
+        PRAGMA journal_mode=WAL;
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hn TEXT UNIQUE,
+            first_name TEXT,
+            last_name TEXT,
+            dob TEXT,
+            ward TEXT,
+            weight REAL,
+            height REAL,
+            hospital TEXT,
+            blood_group TEXT,
+            relative_name TEXT,
+            relative_phone TEXT,
+            underlying_disease TEXT,
+            drug_allergy TEXT,
+            admission_date TEXT,
+            feeding TEXT,
+            foley INTEGER DEFAULT 0,
+            detail TEXT,
+            photo_path TEXT,
+            is_active INTEGER DEFAULT 1,
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE TABLE IF NOT EXISTS nurse_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            hn TEXT,
+            ts TEXT,
+            shift TEXT,
+            section TEXT,
+            field TEXT,
+            value TEXT,
+            created_by TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            care_day TEXT                   -- YYYY-MM-DD the entry counts for (shift_helpers.care_day)
+        );
+        -- physio_logs append-only (per spec)
+        CREATE TABLE IF NOT EXISTS physio_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            log_date TEXT NOT NULL,         -- YYYY-MM-DD
+            physio_type TEXT NOT NULL,      -- 'basic' | 'rehab'
+            section TEXT NOT NULL,          -- e.g. 'Vital (pre)', 'Exercise', 'Functional'
+            field TEXT NOT NULL,            -- label
+            value TEXT,                     -- value
+            created_by TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE TABLE IF NOT EXISTS medications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL,
+            meal_times TEXT,
+            meal_times_other TEXT,
+            timing_radio TEXT,
+            timing_other TEXT,
+            image_path TEXT,
+            drug_name TEXT,
+            drug_type TEXT,
+            how_to TEXT,
+            responsible TEXT,
+            created_by TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE TABLE IF NOT EXISTS staff (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            role TEXT CHECK(role IN ('nurse','physio','pharmacy','admin')) NOT NULL,
+            phone TEXT,
+            email TEXT,
+            username TEXT UNIQUE,
+            password_hash TEXT,
+            last_login TEXT,
+            is_active INTEGER DEFAULT 1,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE TABLE IF NOT EXISTS patient_audit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            action TEXT,
+            changed_at TEXT DEFAULT (datetime('now')),
+            changed_by TEXT,
+            before_data TEXT,
+            after_data TEXT
+        );
+        """)
+        _ensure_columns(conn, "medications", [
+            ("start_date", "TEXT"),
+            ("note", "TEXT"),
+            ("active", "INTEGER DEFAULT 1"),
+            ("inactive_date", "TEXT"),
+        ])
+        _ensure_columns(conn, "nurse_logs", [("care_day", "TEXT")])
+        for table in ("nurse_logs", "physio_logs"):
+            _ensure_columns(conn, table, [(col, "INTEGER") for col in labels.ENCODED.values()])
+        _drop_stale_indexes(conn, ("idx_nurse_logs_care_day", "idx_nurse_logs_field_ts", "idx_physio_logs_day"), "section_id")
+        c.executescript("""
+        -- one row per (medication, meal slot); medications.meal_times is kept as a
+        -- denormalized copy for the print builders and the edit form
+        CREATE TABLE IF NOT EXISTS medication_schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medication_id INTEGER NOT NULL,
+            meal_slot TEXT NOT NULL,        -- เช้า | กลางวัน | เย็น | ก่อนนอน | อื่นๆ
+            timing TEXT,                    -- ก่อนอาหาร | หลังอาหาร | อื่นๆ
+            active INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE INDEX IF NOT EXISTS idx_medsched_med ON medication_schedule(medication_id, active);
+        CREATE INDEX IF NOT EXISTS idx_medications_patient ON medications(patient_id);
+        CREATE INDEX IF NOT EXISTS idx_medsched_slot ON medication_schedule(meal_slot, timing, active);
+        -- section / field / created_by of the log tables are ids into label_dict (labels.py);
+        -- the text columns are '' / NULL once a row is encoded
+        CREATE TABLE IF NOT EXISTS label_dict (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            label TEXT NOT NULL UNIQUE
+        );
+        -- prefill / print / API read one patient's care day (both shifts) as a single range
+        CREATE INDEX IF NOT EXISTS idx_nurse_logs_care_day ON nurse_logs(patient_id, care_day, shift, section_id, field_id, ts);
+        CREATE INDEX IF NOT EXISTS idx_nurse_logs_no_care_day ON nurse_logs(id) WHERE care_day IS NULL;
+        -- history viewer: newest-first keyset pages, all fields or one (section, field)
+        CREATE INDEX IF NOT EXISTS idx_nurse_logs_patient_ts ON nurse_logs(patient_id, ts, id);
+        CREATE INDEX IF NOT EXISTS idx_nurse_logs_field_ts ON nurse_logs(patient_id, section_id, field_id, ts, id);
+        CREATE INDEX IF NOT EXISTS idx_physio_logs_day ON physio_logs(patient_id, log_date, physio_type, section_id, field_id);
+        -- rows still stored as text (init_db checks, encode_log_labels works through these)
+        CREATE INDEX IF NOT EXISTS idx_nurse_logs_unencoded ON nurse_logs(id) WHERE section <> '';
+        CREATE INDEX IF NOT EXISTS idx_physio_logs_unencoded ON physio_logs(id) WHERE section <> '';
+        -- append-only change feed over the clinical tables (changefeed.py); one row per
+        -- written row, ids only grow so consumers keep a cursor instead of rescanning
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL,               -- I | U | D | A (archived by compact_logs.py)
+            row_id INTEGER NOT NULL,
+            patient_id INTEGER,
+            at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_change_log_patient ON change_log(patient_id, id);
+        CREATE TRIGGER IF NOT EXISTS trg_nurse_logs_cl_i AFTER INSERT ON nurse_logs BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('nurse_logs', 'I', NEW.id, NEW.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_nurse_logs_cl_u AFTER UPDATE ON nurse_logs BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('nurse_logs', 'U', NEW.id, NEW.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_nurse_logs_cl_d AFTER DELETE ON nurse_logs BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('nurse_logs', 'D', OLD.id, OLD.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_physio_logs_cl_i AFTER INSERT ON physio_logs BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('physio_logs', 'I', NEW.id, NEW.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_physio_logs_cl_u AFTER UPDATE ON physio_logs BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('physio_logs', 'U', NEW.id, NEW.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_physio_logs_cl_d AFTER DELETE ON physio_logs BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('physio_logs', 'D', OLD.id, OLD.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_medications_cl_i AFTER INSERT ON medications BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('medications', 'I', NEW.id, NEW.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_medications_cl_u AFTER UPDATE ON medications BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('medications', 'U', NEW.id, NEW.patient_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_medications_cl_d AFTER DELETE ON medications BEGIN
+            INSERT INTO change_log (tbl, op, row_id, patient_id) VALUES ('medications', 'D', OLD.id, OLD.patient_id);
+        END;
+        -- superseded nurse_logs / physio_logs rows moved out by compact_logs.py, one zlib'd
+        -- JSON list of full rows per (table, patient, day) and run
+        CREATE TABLE IF NOT EXISTS log_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            patient_id INTEGER,
+            day TEXT NOT NULL,              -- nurse_logs.care_day / physio_logs.log_date
+            n_rows INTEGER NOT NULL,
+            rows_z BLOB NOT NULL,
+            archived_at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_log_archive_patient ON log_archive(patient_id, tbl, day);
+        CREATE INDEX IF NOT EXISTS idx_log_archive_day ON log_archive(tbl, day);
+        -- persistent logins (remember_login.py)
+        CREATE TABLE IF NOT EXISTS auth_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_hash TEXT NOT NULL,
+            created_at TEXT DEFAULT (datetime('now')),
+            expires_at TEXT,
+            is_revoked INTEGER DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_auth_token_hash ON auth_tokens(token_hash);
+        -- drug names for the medication form autocomplete (see drug_catalog.py)
+        CREATE TABLE IF NOT EXISTS drug_catalog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name_key TEXT NOT NULL UNIQUE,  -- drug_catalog.normalize(drug_name)
+            drug_name TEXT NOT NULL,
+            drug_type TEXT,
+            how_to TEXT,
+            uses INTEGER NOT NULL DEFAULT 0
+        );
+        -- per-meal "Inactive" is a single-row UPDATE of medication_schedule; this keeps
+        -- meal_times in sync and retires the medication when its last slot goes
+        CREATE TRIGGER IF NOT EXISTS trg_medsched_deactivate
+        AFTER UPDATE OF active ON medication_schedule
+        WHEN OLD.active=1 AND NEW.active=0
+        BEGIN
+            UPDATE medications SET
+                meal_times = COALESCE(
+                    (SELECT group_concat(meal_slot, ',') FROM medication_schedule
+                     WHERE medication_id=NEW.medication_id AND active=1),
+                    meal_times),
+                active = CASE WHEN EXISTS (SELECT 1 FROM medication_schedule
+                                           WHERE medication_id=NEW.medication_id AND active=1)
+                              THEN active ELSE 0 END,
+                inactive_date = CASE WHEN EXISTS (SELECT 1 FROM medication_schedule
+                                                  WHERE medication_id=NEW.medication_id AND active=1)
+                                     THEN inactive_date ELSE date('now') END
+            WHERE id=NEW.medication_id;
+        END;
+        """)
+        c.executescript(FORM_SNAPSHOTS_SQL)
+        _backfill_medication_schedule(conn)
+        _seed_drug_catalog(conn)
+        conn.commit()
+        _backfill_care_day(conn)
+        if _has_text_labels(conn):
+            # the rewrite is one-way and long on a big file: only `labels.py --migrate` does it
+            print("db: nurse_logs / physio_logs rows still store label text; "
+                  "run `python labels.py --migrate` (reads handle both meanwhile)", file=sys.stderr)
+
+
+def split_meal_times(s):
+    """'เช้า,เย็น' -> ['เช้า', 'เย็น'] (an empty value counts as the 'อื่นๆ' slot)."""
+    return [m.strip() for m in str(s or "").split(",") if m and m.strip()] or ["อื่นๆ"]
+
+
+def _backfill_medication_schedule(conn):
+    """Create schedule rows for medications written before medication_schedule existed."""
+    rows = conn.execute(
+        "SELECT id, meal_times, timing_radio, COALESCE(active,1) FROM medications m "
+        "WHERE NOT EXISTS (SELECT 1 FROM medication_schedule s WHERE s.medication_id=m.id)"
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO medication_schedule (medication_id, meal_slot, timing, active) VALUES (?,?,?,?)",
+        [(mid, slot, timing, active) for mid, mt, timing, active in rows for slot in split_meal_times(mt)],
+    )
+
+
+def _without_update_log(conn, tables, fn):
+    """Run fn() in one BEGIN IMMEDIATE transaction with the change-feed UPDATE triggers of
+    tables dropped, so a backfill doesn't replay every row into change_log."""
+    triggers = [
+        r[0] for r in conn.execute(
+            f"SELECT sql FROM sqlite_master WHERE type='trigger' AND name IN ({','.join('?' * len(tables))})",
+            [f"trg_{t}_cl_u" for t in tables],
+        )
+    ]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for t in tables:
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{t}_cl_u")
+        out = fn()
+        for sql in triggers:
+            conn.execute(sql)
+        conn.commit()
+        return out
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _backfill_care_day(conn):
+    """care_day for rows written before the column existed. Every writer so far put the day
+    the entry was made for into ts, so that date is kept (not re-derived from the clock time)."""
+    if not conn.execute("SELECT 1 FROM nurse_logs WHERE care_day IS NULL LIMIT 1").fetchone():
+        return
+    _without_update_log(conn, ("nurse_logs",), lambda: conn.execute(
+        "UPDATE nurse_logs SET care_day=COALESCE(substr(ts,1,10), substr(created_at,1,10)) WHERE care_day IS NULL"
+    ))
+
+
+def _has_text_labels(conn):
+    """Rows not yet moved to label ids (a probe of the idx_*_unencoded partial indexes)."""
+    return any(conn.execute(f"SELECT 1 FROM {t} WHERE section <> '' LIMIT 1").fetchone()
+               for t in ("nurse_logs", "physio_logs"))
+
+
+def _encode_labels(conn, batch=5000, pause_ms=0, log=None):
+    """Move section / field / created_by of rows still stored as text into label_dict ids,
+    batch rows per transaction (oldest first) -> rows encoded."""
+    total = 0
+    for table in ("nurse_logs", "physio_logs"):
+        while True:
+            rows = conn.execute(
+                f"SELECT id, section, field, created_by FROM {table} WHERE section <> '' ORDER BY id LIMIT ?",
+                (batch,),
+            ).fetchall()
+            if not rows:
+                break
+
+            def encode():
+                texts = {t for r in rows for t in r[1:] if t not in (None, "")}
+                conn.executemany("INSERT OR IGNORE INTO label_dict (label) VALUES (?)", [(t,) for t in texts])
+                ids = dict(conn.execute("SELECT label, id FROM label_dict"))
+                conn.executemany(
+                    f"UPDATE {table} SET section_id=?, field_id=?, created_by_id=?, "
+                    f"section='', field='', created_by=NULL WHERE id=?",
+                    [(ids.get(sec), ids.get(fld), ids.get(by), rid) for rid, sec, fld, by in rows],
+                )
+
+            _without_update_log(conn, (table,), encode)
+            total += len(rows)
+            if log:
+                log(f"{table}: {total} rows encoded (up to id {rows[-1][0]})")
+            if pause_ms:
+                time.sleep(pause_ms / 1000.0)
+    return total
+
+
+def encode_log_labels(db_path=None, batch=5000, pause_ms=0, log=None):
+    """Encode whatever nurse_logs / physio_logs rows are still text (labels.py --migrate) -> rows.
+    Runs while the app is up: each batch is one short write transaction."""
+    if db_path is None and DB_URL:
+        return get_backend().encode_labels(batch, pause_ms, log)
+    with closing(sqlite3.connect(db_path or DB_PATH, timeout=db_writer.BUSY_TIMEOUT_MS / 1000.0)) as conn:
+        conn.execute(f"PRAGMA busy_timeout={db_writer.BUSY_TIMEOUT_MS}")
+        return _encode_labels(conn, batch, pause_ms, log)
+
+
+def _drop_stale_indexes(conn, names, must_contain):
+    """Drop indexes whose stored definition predates a column change; the schema script recreates them."""
+    for name, sql in conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type='index' AND name IN ({','.join('?' * len(names))})", names
+    ).fetchall():
+        if must_contain not in (sql or ""):
+            conn.execute(f"DROP INDEX {name}")
+
+
+def _seed_drug_catalog(conn):
+    """Add drug names from medications that the catalog doesn't know yet (latest type/how_to wins)."""
+    known = {r[0] for r in conn.execute("SELECT name_key FROM drug_catalog")}
+    new = {}
+    for name, dtype, how_to in conn.execute(
+        "SELECT drug_name, drug_type, how_to FROM medications "
+        "WHERE TRIM(COALESCE(drug_name,''))<>'' "
+        "AND LOWER(TRIM(drug_name)) NOT IN (SELECT name_key FROM drug_catalog) ORDER BY id"
+    ):
+        key = normalize_drug_name(name)
+        if key in known:
+            continue
+        e = new.setdefault(key, [" ".join(name.split()), None, None, 0])
+        e[1], e[2], e[3] = dtype or e[1], how_to or e[2], e[3] + 1
+    conn.executemany(
+        "INSERT INTO drug_catalog (name_key, drug_name, drug_type, how_to, uses) VALUES (?,?,?,?,?)",
+        [(k, *e) for k, e in new.items()],
+    )
+
+
+def _ensure_columns(conn, table, columns):
+    """Add columns introduced after the table was first created (older clinic.db files)."""
+    have = storage.sqlite_columns(conn, table)
+    for name, decl in columns:
+        if name not in have:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
@@ -0,0 +1,189 @@
+# db_writer.py — single writer thread for SQLite writes
+# Every non-fetch db.run_query is handed to one thread per DB file instead of opening its
+# own connection and committing. The thread takes whatever is queued (up to MAX_BATCH,
+# waiting LINGER_MS for stragglers) and commits it as one transaction, so 15 nurses saving
+# at shift change become a few commits instead of 15 writers fighting for the lock.
+# Each statement runs inside its own SAVEPOINT: a failing statement is rolled back alone
+# and only its caller sees the error (any exception, not just sqlite3 ones). Writer.call runs
+# several statements as one such unit (db.run_transaction). If the thread
+# dies anyway, the next submit starts a new one; a caller waits at most HH_WRITE_TIMEOUT_MS.
+#
+# Env:
+#   HH_DB_WRITER          0 to write directly from the calling thread (default 1)
+#   HH_WRITE_BATCH        max statements per transaction (default 200)
+#   HH_WRITE_LINGER_MS    how long to wait for more statements before committing (default 2)
+#   HH_BUSY_TIMEOUT_MS    busy timeout of the writer connection (default 30000)
+#   HH_WRITE_TIMEOUT_MS   how long a caller waits for its statement (default 60000)
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import perf
+
+ENABLED = os.getenv("HH_DB_WRITER", "1").strip().lower() not in ("0", "false", "no", "off")
+MAX_BATCH = int(os.getenv("HH_WRITE_BATCH", "200") or 200)
+LINGER_MS = float(os.getenv("HH_WRITE_LINGER_MS", "2") or 0)
+BUSY_TIMEOUT_MS = int(os.getenv("HH_BUSY_TIMEOUT_MS", "30000") or 30000)
+WRITE_TIMEOUT_MS = int(os.getenv("HH_WRITE_TIMEOUT_MS", "60000") or 60000)
+
+_STOP = object()
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class Writer:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        """Start the writer thread, or a new one if the previous one died."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"db-writer:{self.db_path}", daemon=True)
+                self._thread.start()
+
+    def submit(self, sql, params=(), many=False):
+        """Queue one statement (or a callable fn(conn), see call) -> Future resolving to
+        (lastrowid, rowcount) / fn's return value, or the error it raised."""
+        self._ensure_thread()
+        fut = Future()
+        self._q.put((sql, params, many, fut))
+        return fut
+
+    def write(self, sql, params=(), many=False, timeout_ms=None):
+        """submit() and wait -> (lastrowid, rowcount); sqlite3.OperationalError if the writer
+        doesn't answer within timeout_ms (default HH_WRITE_TIMEOUT_MS)."""
+        return self._wait(self.submit(sql, params, many), timeout_ms)
+
+    def call(self, fn, timeout_ms=None):
+        """Run fn(conn) on the writer connection inside its own SAVEPOINT and wait -> fn's
+        return value. Its statements commit together or not at all; fn must not call
+        db.run_query itself (that would wait for this same thread)."""
+        return self._wait(self.submit(fn), timeout_ms)
+
+    def _wait(self, fut, timeout_ms=None):
+        timeout_ms = WRITE_TIMEOUT_MS if timeout_ms is None else timeout_ms
+        try:
+            return fut.result(timeout=timeout_ms / 1000.0)
+        except FutureTimeout:
+            # still queued -> dropped; already running -> it may yet commit
+            state = "not run" if fut.cancel() else "still running"
+            raise sqlite3.OperationalError(
+                f"database writer did not answer within {timeout_ms:.0f} ms (statement {state})") from None
+
+    def stop(self, timeout=5.0):
+        self._q.put(_STOP)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _take_batch(self):
+        first = self._q.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + LINGER_MS / 1000.0
+        while len(batch) < MAX_BATCH:
+            try:
+                item = self._q.get_nowait() if LINGER_MS <= 0 else self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._q.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                break
+            # callers that timed out and cancelled their statement are skipped
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                if conn is None:
+                    conn = self._connect()
+                self._commit_batch(conn, batch)
+            except Exception as e:
+                # connect/BEGIN/COMMIT failed: nothing in this batch was written
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+        if conn is not None:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        t0 = time.perf_counter()
+        done = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params, many, fut in batch:
+                conn.execute("SAVEPOINT w")
+                try:
+                    if callable(sql):
+                        result = sql(conn)
+                    else:
+                        cur = conn.executemany(sql, params) if many else conn.execute(sql, params)
+                        result = cur.lastrowid, cur.rowcount
+                    done.append((fut, result))
+                    conn.execute("RELEASE w")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO w")
+                    conn.execute("RELEASE w")
+                    fut.set_exception(e)
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        for fut, result in done:
+            fut.set_result(result)
+        perf.observe("db.write_batch", time.perf_counter() - t0)
+        perf.incr("db_write_batches")
+        perf.incr("db_write_statements", len(batch))
+
+
+def get_writer(db_path):
+    with _writers_lock:
+        w = _writers.get(db_path)
+        if w is None:
+            w = _writers[db_path] = Writer(db_path)
+        return w
+
+
+def write(db_path, sql, params=(), many=False):
+    """Run one statement on db_path's writer thread and wait -> (lastrowid, rowcount)."""
+    return get_writer(db_path).write(sql, params, many)
+
+
+@atexit.register
+def stop_all():
+    """Drain the queues so statements submitted just before exit are still committed."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for w in writers:
+        w.stop()
@@ -0,0 +1,107 @@
+# drug_catalog.py — drug name catalog for the medication form
+# The drug_catalog table is seeded from the distinct drug names already in medications
+# (db.init_db) and grows with every saved order. The app keeps one DrugCatalog per process
+# (st.cache_resource): entries sorted by normalized name, so a prefix lookup is a bisect
+# plus a short scan, and new names are insort-ed instead of reloading the whole table.
+import re
+import threading
+from bisect import bisect_left, insort
+
+_WS_RE = re.compile(r"\s+")
+# Thai vowel/tone marks are not \w, so split on explicit separators only
+_TOKEN_SPLIT_RE = re.compile(r"[\s,;/|+()\[\]{}:.\-]+")
+# dosage forms / units that say nothing about what a patient is allergic to
+_STOP_TOKENS = frozenset({"tab", "tabs", "cap", "caps", "syr", "inj", "susp", "sol", "cream", "drop", "drops",
+                          "ยา", "แพ้", "แพ้ยา", "ไม่มี", "ไม่ทราบ"})
+
+
+def normalize(name):
+    """Catalog key: case-folded, trimmed, inner whitespace collapsed."""
+    return _WS_RE.sub(" ", str(name or "")).strip().casefold()
+
+
+def tokens(text):
+    """Normalized words of a drug name or an allergy note (short, numeric and unit words dropped)."""
+    return frozenset(
+        t for t in _TOKEN_SPLIT_RE.split(normalize(text))
+        if len(t) >= 3 and not any(ch.isdigit() for ch in t) and t not in _STOP_TOKENS
+    )
+
+
+def allergy_match(allergy_tokens, drug_name):
+    """Words of drug_name found in the patient's allergy tokens (set lookups, empty if none)."""
+    return sorted(t for t in tokens(drug_name) if t in allergy_tokens)
+
+
+class DrugCatalog:
+    def __init__(self, rows=()):
+        self._lock = threading.Lock()
+        self._keys = []       # sorted normalized names (bisect target)
+        self._entries = {}    # normalized name -> {"drug_name", "drug_type", "how_to", "uses"}
+        for r in rows:
+            self._put(r)
+
+    @classmethod
+    def load(cls, run_query):
+        return cls(run_query(
+            "SELECT drug_name, drug_type, how_to, uses FROM drug_catalog", fetch=True
+        ) or [])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _put(self, r):
+        key = normalize(r.get("drug_name"))
+        if not key:
+            return
+        if key not in self._entries:
+            insort(self._keys, key)
+        self._entries[key] = {
+            "drug_name": r.get("drug_name"),
+            "drug_type": r.get("drug_type") or "",
+            "how_to": r.get("how_to") or "",
+            "uses": r.get("uses") or 0,
+        }
+
+    def get(self, name):
+        return self._entries.get(normalize(name))
+
+    def prefix(self, q, limit=20):
+        """Entries whose name starts with q, most used first."""
+        key = normalize(q)
+        if not key:
+            return []
+        with self._lock:
+            i = bisect_left(self._keys, key)
+            found = []
+            while i < len(self._keys) and self._keys[i].startswith(key) and len(found) < limit * 5:
+                found.append(self._entries[self._keys[i]])
+                i += 1
+        found.sort(key=lambda e: (-e["uses"], e["drug_name"]))
+        return found[:limit]
+
+    def add(self, run_query, drug_name, drug_type=None, how_to=None):
+        """Record a saved order: upsert the catalog row and update the in-memory index."""
+        key = normalize(drug_name)
+        if not key:
+            return
+        name = _WS_RE.sub(" ", drug_name).strip()
+        run_query(
+            """
+            INSERT INTO drug_catalog (name_key, drug_name, drug_type, how_to, uses)
+            VALUES (?,?,?,?,1)
+            ON CONFLICT(name_key) DO UPDATE SET
+                drug_type = COALESCE(excluded.drug_type, drug_catalog.drug_type),
+                how_to = COALESCE(excluded.how_to, drug_catalog.how_to),
+                uses = drug_catalog.uses + 1
+            """,
+            (key, name, drug_type or None, how_to or None),
+        )
+        with self._lock:
+            old = self._entries.get(key) or {}
+            self._put({
+                "drug_name": old.get("drug_name") or name,
+                "drug_type": drug_type or old.get("drug_type"),
+                "how_to": how_to or old.get("how_to"),
+                "uses": (old.get("uses") or 0) + 1,
+            })
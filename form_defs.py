@@ -0,0 +1,144 @@
+# form_defs.py — field definitions of the nurse and physio forms
+# Single source of truth for the (section, field) labels written to nurse_logs / physio_logs.
+# app.py builds its prefill from these; bulk_import.py validates rows against them.
+
+# (widget key, shift, section, field)
+NURSE_FIELDS = [
+    # night
+    ("T_n", "night", "สัญญาณชีพ", "T/อุณหภูมิ"),
+    ("BP_n", "night", "สัญญาณชีพ", "BP/ความดัน"),
+    ("HR_n", "night", "สัญญาณชีพ", "HR/อัตราการเต้นหัวใจ"),
+    ("RR_n", "night", "สัญญาณชีพ", "RR/อัตราการหายใจ"),
+    ("SpO2_n", "night", "สัญญาณชีพ", "SpO2/ค่าออกซิเจน"),
+    ("DTX_n", "night", "สัญญาณชีพ", "DTX/ระดับน้ำตาลในเลือด"),
+    ("Intake_n", "night", "สัญญาณชีพ", "Intake/น้ำเข้าร่างกาย"),
+    ("Output_n", "night", "สัญญาณชีพ", "Output/ปัสสาวะ"),
+    ("Stool_n", "night", "สัญญาณชีพ", "Stool/อุจจาระ"),
+    ("Cough_n", "night", "ทางเดินหายใจ", "อาการไอ/มีเสมหะ"),
+    ("Sputum_n", "night", "ทางเดินหายใจ", "ลักษณะ"),
+    ("Suction_n", "night", "ทางเดินหายใจ", "Suction/การดูดเสมหะ"),
+    ("Lines_n", "night", "ทางเดินหายใจ", "จำนวนสายSuction"),
+    ("PostSuction_n", "night", "ทางเดินหายใจ", "อาการหลังSuction"),
+    ("sleep_n", "night", "กลางคืน", "การนอนหลับ"),
+    ("night_food_n", "night", "กลางคืน", "การรับประทานอาหาร"),
+    ("detail_n", "night", "กลางคืน", "รายละเอียดเพิ่มเติม"),
+    ("note_night", "night", "กลางคืน", "หมายเหตุ"),
+    ("caregiver_n", "night", "กลางคืน", "ผู้ดูแล"),
+    ("head_night", "night", "กลางคืน", "หัวหน้าเวร"),
+    # day
+    ("T_d", "day", "สัญญาณชีพ", "T/อุณหภูมิ"),
+    ("BP_d", "day", "สัญญาณชีพ", "BP/ความดัน"),
+    ("HR_d", "day", "สัญญาณชีพ", "HR/อัตราการเต้นหัวใจ"),
+    ("RR_d", "day", "สัญญาณชีพ", "RR/อัตราการหายใจ"),
+    ("SpO2_d", "day", "สัญญาณชีพ", "SpO2/ค่าออกซิเจน"),
+    ("DTX_d", "day", "สัญญาณชีพ", "DTX/ระดับน้ำตาลในเลือด"),
+    ("Intake_d", "day", "สัญญาณชีพ", "Intake/น้ำเข้าร่างกาย"),
+    ("Output_d", "day", "สัญญาณชีพ", "Output/ปัสสาวะ"),
+    ("Stool_d", "day", "สัญญาณชีพ", "Stool/อุจจาระ"),
+    ("Cough_d", "day", "ทางเดินหายใจ", "อาการไอ/มีเสมหะ"),
+    ("Sputum_d", "day", "ทางเดินหายใจ", "ลักษณะ"),
+    ("Suction_d", "day", "ทางเดินหายใจ", "Suction/การดูดเสมหะ"),
+    ("Lines_d", "day", "ทางเดินหายใจ", "จำนวนสายSuction"),
+    ("PostSuction_d", "day", "ทางเดินหายใจ", "อาการหลังSuction"),
+    ("eat_normal_d", "day", "กลางวัน", "การรับประทานอาหาร"),
+    ("eat_ng_d", "day", "กลางวัน", "รับอาหารทางสายยาง"),
+    ("eat_abn_d", "day", "กลางวัน", "อาการผิดปกติหลังให้อาหาร"),
+    ("activity_d", "day", "กลางวัน", "การออกกำลังกายและกิจกรรมระหว่างวัน"),
+    ("detail_d", "day", "กลางวัน", "รายละเอียดเพิ่มเติม"),
+    ("note_day", "day", "กลางวัน", "หมายเหตุ"),
+    ("caregiver_d", "day", "กลางวัน", "ผู้ดูแล"),
+    ("head_day", "day", "กลางวัน", "หัวหน้าเวร"),
+]
+NURSE_KEYS = [k for k, _, _, _ in NURSE_FIELDS]
+
+# (widget key, physio types the field appears in, section, field)
+_BOTH = ("basic", "rehab")
+PHYSIO_FIELDS = [
+    ("pre_bp", _BOTH, "Vital (pre)", "BP"),
+    ("pre_hr", _BOTH, "Vital (pre)", "HR"),
+    ("pre_rr", _BOTH, "Vital (pre)", "RR"),
+    ("pre_spo2", _BOTH, "Vital (pre)", "SpO2"),
+    ("pre_sym", _BOTH, "Vital (pre)", "Symptoms"),
+    ("post_bp", _BOTH, "Vital (post)", "BP"),
+    ("post_hr", _BOTH, "Vital (post)", "HR"),
+    ("post_rr", _BOTH, "Vital (post)", "RR"),
+    ("post_spo2", _BOTH, "Vital (post)", "SpO2"),
+    ("post_sym", _BOTH, "Vital (post)", "Symptoms"),
+    ("activity", ("basic",), "Basic", "Activity"),
+    ("result", ("basic",), "Basic", "Result"),
+    ("remark", ("basic",), "Basic", "Remark"),
+    ("assistant", ("basic",), "Basic", "Assistant"),
+    ("e_min", ("rehab",), "Exercise", "Minutes"),
+    ("e_act", ("rehab",), "Exercise", "Activity"),
+    ("e_res", ("rehab",), "Exercise", "Result"),
+    ("f_min", ("rehab",), "Functional", "Minutes"),
+    ("f_act", ("rehab",), "Functional", "Activity"),
+    ("f_res", ("rehab",), "Functional", "Result"),
+    ("g_dist", ("rehab",), "Gait", "Distance (m)"),
+    ("g_act", ("rehab",), "Gait", "Activity"),
+    ("g_res", ("rehab",), "Gait", "Result"),
+    ("el_min", ("rehab",), "Electrical", "Minutes"),
+    ("el_act", ("rehab",), "Electrical", "Activity"),
+    ("el_res", ("rehab",), "Electrical", "Result"),
+    ("sp_min", ("rehab",), "Speech", "Minutes"),
+    ("sp_act1", ("rehab",), "Speech", "Activity1"),
+    ("sp_res1", ("rehab",), "Speech", "Result1"),
+    ("sp_act2", ("rehab",), "Speech", "Activity2"),
+    ("sp_res2", ("rehab",), "Speech", "Result2"),
+    ("cg_min", ("rehab",), "Cognitive", "Minutes"),
+    ("cg_act", ("rehab",), "Cognitive", "Activity"),
+    ("cg_res", ("rehab",), "Cognitive", "Result"),
+    ("physio_name", _BOTH, "Meta", "Physio"),
+    ("note", _BOTH, "Meta", "Note"),
+]
+PHYSIO_KEYS = [k for k, _, _, _ in PHYSIO_FIELDS]
+
+# Vitals of the nurse form that form_snapshots exposes as generated columns, so trend/print
+# reads don't parse the JSON payload: (column, widget key prefix (_d / _n), numeric)
+SNAPSHOT_VITALS = [
+    ("temperature", "T", True),
+    ("bp", "BP", False),
+    ("heart_rate", "HR", True),
+    ("resp_rate", "RR", True),
+    ("spo2", "SpO2", True),
+    ("dtx", "DTX", True),
+]
+
+# Columns of the tables the forms wrote before nurse_logs / physio_logs (vitals,
+# physio_sessions), still present in older clinic.db files -> widget keys above.
+# migrate_legacy.py moves their rows into the logs under these labels.
+LEGACY_VITALS_COLUMNS = {  # column -> (day key, night key)
+    "temperature": ("T_d", "T_n"),
+    "bp": ("BP_d", "BP_n"),
+    "heart_rate": ("HR_d", "HR_n"),
+    "resp_rate": ("RR_d", "RR_n"),
+    "spo2": ("SpO2_d", "SpO2_n"),
+    "dtx": ("DTX_d", "DTX_n"),
+    "intake_ml": ("Intake_d", "Intake_n"),
+    "output_times": ("Output_d", "Output_n"),
+    "stool": ("Stool_d", "Stool_n"),
+    "note": ("note_day", "note_night"),
+    "caregiver_name": ("caregiver_d", "caregiver_n"),
+    "head_nurse_name": ("head_day", "head_night"),
+}
+# physio_sessions had no physio type; its fields are those of the basic form.
+# Columns named like a basic widget key (pre_rr, remark, ...) map to that key as well.
+LEGACY_PHYSIO_TYPE = "basic"
+LEGACY_PHYSIO_COLUMNS = {"therapist": "physio_name"}
+
+# Accepted spellings for shift / physio type in imported files
+SHIFT_ALIASES = {"day": "day", "กลางวัน": "day", "night": "night", "กลางคืน": "night"}
+PHYSIO_TYPE_ALIASES = {
+    "basic": "basic", "กายภาพพื้นฐาน": "basic",
+    "rehab": "rehab", "กายภาพฟื้นฟู": "rehab",
+}
+
+
+def nurse_labels():
+    """Set of valid (shift, section, field) triples."""
+    return {(shift, sec, fld) for _, shift, sec, fld in NURSE_FIELDS}
+
+
+def physio_labels():
+    """Set of valid (physio_type, section, field) triples."""
+    return {(pt, sec, fld) for _, types, sec, fld in PHYSIO_FIELDS for pt in types}
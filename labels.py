@@ -0,0 +1,253 @@
+# labels.py — dictionary encoding of the repeated text in nurse_logs / physio_logs
+# section, field and created_by are stored as small integer ids into label_dict
+# (section_id / field_id / created_by_id); the text columns stay in the schema (physio_logs
+# declares them NOT NULL) but are '' / NULL for encoded rows. Each process keeps one
+# bidirectional map per database (loaded once, reloaded only on a miss), so writes and
+# filters never join label_dict and reads decode ids in Python.
+# Rows written before this keep their text until `labels.py --migrate` encodes them (batched,
+# while the app runs); init_db only reports that they exist. Until then reads see a mix of
+# text and id rows: decode leaves text rows alone and filters also match the text.
+#
+# Run:
+#   python labels.py --migrate                  # encode HH_DB_PATH (or HH_DB_URL) in batches
+#   python labels.py --compare /tmp/demo.db     # size + latency before/after, on copies of the file
+import argparse
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+# text column -> id column, the same for both log tables
+ENCODED = {"section": "section_id", "field": "field_id", "created_by": "created_by_id"}
+
+
+class LabelDict:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}      # label -> id
+        self._labels = {}   # id -> label
+        self._encoded = set()  # log tables known to hold no text rows (stays so: writers store ids)
+
+    def load(self, run_query):
+        rows = run_query("SELECT id, label FROM label_dict", fetch=True) or []
+        with self._lock:
+            for r in rows:
+                self._ids[r["label"]] = r["id"]
+                self._labels[r["id"]] = r["label"]
+        return self
+
+    def id(self, run_query, label, create=True):
+        """id of a label (None for empty); create=False -> None when the label was never stored."""
+        if label in (None, ""):
+            return None
+        label = str(label)
+        hit = self._ids.get(label)
+        if hit is None:
+            if create:
+                run_query("INSERT INTO label_dict (label) VALUES (?) ON CONFLICT(label) DO NOTHING", (label,))
+            rows = run_query("SELECT id FROM label_dict WHERE label=?", (label,), fetch=True)
+            if not rows:
+                return None
+            hit = rows[0]["id"]
+            with self._lock:
+                self._ids[label] = hit
+                self._labels[hit] = label
+        return hit
+
+    def has_text_rows(self, run_query, table):
+        """Rows of table still stored as text, i.e. `labels.py --migrate` hasn't finished
+        (one probe of idx_*_unencoded; cached once it says no)."""
+        if table in self._encoded:
+            return False
+        if run_query(f"SELECT 1 FROM {table} WHERE section <> '' LIMIT 1", fetch=True):
+            return True
+        self._encoded.add(table)
+        return False
+
+    def label(self, run_query, label_id):
+        if label_id is None:
+            return None
+        hit = self._labels.get(label_id)
+        if hit is None:
+            hit = self.load(run_query)._labels.get(label_id)
+        return hit
+
+    def decode(self, run_query, rows):
+        """Fill section / field / created_by of log rows from their ids (in place) -> rows."""
+        for r in rows:
+            for text_col, id_col in ENCODED.items():
+                if not r.get(text_col) and r.get(id_col) is not None:
+                    r[text_col] = self.label(run_query, r[id_col])
+        return rows
+
+
+_dicts = {}   # (run_query, database) -> LabelDict
+_dicts_lock = threading.Lock()
+
+
+def _key(run_query):
+    # db.run_query follows db.DB_PATH, which tools reassign: one map per database
+    run_query = getattr(run_query, "labels_of", run_query)  # db.run_transaction's run_query
+    db = sys.modules.get("db")
+    if db is not None and run_query is getattr(db, "run_query", None):
+        return run_query, db.DB_URL or db.DB_PATH
+    return run_query, None
+
+
+def for_query(run_query):
+    """The process-wide LabelDict of the database behind run_query."""
+    key = _key(run_query)
+    d = _dicts.get(key)
+    if d is None:
+        with _dicts_lock:
+            d = _dicts.get(key)
+            if d is None:
+                d = _dicts[key] = LabelDict().load(run_query)
+    return d
+
+
+def reset():
+    """Forget every loaded map (db.set_backend: same run_query, different database)."""
+    with _dicts_lock:
+        _dicts.clear()
+
+
+def decode(run_query, rows):
+    return for_query(run_query).decode(run_query, rows)
+
+
+def conn_query(conn):
+    """run_query-style callable over a raw sqlite3 connection (tools that batch on their own)."""
+    def run_query(sql, params=(), fetch=False):
+        cur = conn.execute(sql, params)
+        if fetch:
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+        return cur.lastrowid
+    return run_query
+
+
+# ---------------- CLI ----------------
+def _size(path):
+    return Path(path).stat().st_size
+
+
+def _timings(path, encoded, repeat=20):
+    """Median ms of the log-table reads the app does (text or id form), on one patient/day."""
+    import statistics
+    with closing(sqlite3.connect(path)) as conn:
+        conn.row_factory = sqlite3.Row
+        pid, day = conn.execute(
+            "SELECT patient_id, care_day FROM nurse_logs WHERE care_day IS NOT NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if encoded:
+            ids = dict(conn.execute("SELECT label, id FROM label_dict").fetchall())
+            sec, fld = ids.get("สัญญาณชีพ"), ids.get("T/อุณหภูมิ")
+            cases = {
+                "prefill.nurse": ("SELECT shift, section_id, field_id, value FROM nurse_logs "
+                                  "WHERE patient_id=? AND care_day=? ORDER BY ts, id", (pid, day)),
+                "history.page": ("SELECT id, ts, shift, section_id, field_id, value, created_by_id FROM nurse_logs "
+                                 "WHERE patient_id=? ORDER BY ts DESC, id DESC LIMIT 50", (pid,)),
+                "history.field": ("SELECT id, ts, shift, section_id, field_id, value, created_by_id FROM nurse_logs "
+                                  "WHERE patient_id=? AND section_id=? AND field_id=? ORDER BY ts DESC, id DESC LIMIT 50",
+                                  (pid, sec, fld)),
+            }
+        else:
+            cases = {
+                "prefill.nurse": ("SELECT shift, section, field, value FROM nurse_logs "
+                                  "WHERE patient_id=? AND care_day=? ORDER BY ts, id", (pid, day)),
+                "history.page": ("SELECT id, ts, shift, section, field, value, created_by FROM nurse_logs "
+                                 "WHERE patient_id=? ORDER BY ts DESC, id DESC LIMIT 50", (pid,)),
+                "history.field": ("SELECT id, ts, shift, section, field, value, created_by FROM nurse_logs "
+                                  "WHERE patient_id=? AND section=? AND field=? ORDER BY ts DESC, id DESC LIMIT 50",
+                                  (pid, "สัญญาณชีพ", "T/อุณหภูมิ")),
+            }
+        rq = conn_query(conn)
+        d = LabelDict().load(rq) if encoded else None
+        out = {}
+        for name, (sql, params) in cases.items():
+            samples = []
+            for i in range(repeat + 1):
+                t0 = time.perf_counter()
+                rows = [dict(r) for r in conn.execute(sql, params)]
+                if encoded:
+                    d.decode(rq, rows)
+                if i:  # first run warms the cache
+                    samples.append((time.perf_counter() - t0) * 1000.0)
+            out[name] = statistics.median(samples)
+        out["index pages"] = conn.execute(
+            "SELECT COUNT(*) FROM dbstat WHERE name LIKE 'idx_nurse_logs%' OR name LIKE 'idx_physio_logs%'"
+        ).fetchone()[0] if _has_dbstat(conn) else None
+    return out
+
+
+def _has_dbstat(conn):
+    try:
+        conn.execute("SELECT 1 FROM dbstat LIMIT 1")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def compare(src):
+    """Encode a copy of a not-yet-encoded DB; print file size (after VACUUM) and read latency before/after."""
+    import db
+    with closing(sqlite3.connect(src)) as conn:
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(nurse_logs)")}
+        if "section_id" in cols and conn.execute(
+                "SELECT 1 FROM nurse_logs WHERE section <> '' LIMIT 1").fetchone() is None:
+            print(f"{src} is already encoded: compare on a copy taken before upgrading", file=sys.stderr)
+            return 1
+    with tempfile.TemporaryDirectory(prefix="hh_labels_") as tmp:
+        before, after = Path(tmp) / "before.db", Path(tmp) / "after.db"
+        with closing(sqlite3.connect(src)) as s, closing(sqlite3.connect(before)) as d:
+            s.backup(d)
+        with closing(sqlite3.connect(before)) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("VACUUM")
+        shutil.copy(before, after)
+        db.init_db(str(after))
+        t0 = time.perf_counter()
+        db.encode_log_labels(str(after), pause_ms=0)
+        migrate_s = time.perf_counter() - t0
+        with closing(sqlite3.connect(after)) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("VACUUM")
+        rows = [("file size (MB)", _size(before) / 1e6, _size(after) / 1e6)]
+        t_before, t_after = _timings(before, False), _timings(after, True)
+    for name in t_after:
+        rows.append((name if name == "index pages" else f"{name} (ms)", t_before[name], t_after[name]))
+    print(f"{'':24} {'before':>10} {'after':>10}")
+    for name, b, a in rows:
+        if b is None or a is None:
+            continue
+        print(f"{name:24} {b:10.3f} {a:10.3f}")
+    print(f"migration (--migrate on the copy, no pauses): {migrate_s:.1f}s")
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="label_dict encoding of nurse_logs / physio_logs")
+    ap.add_argument("--migrate", action="store_true", help="encode rows still stored as text")
+    ap.add_argument("--batch", type=int, default=5000)
+    ap.add_argument("--pause-ms", type=float, default=20.0, help="pause between batches with --migrate")
+    ap.add_argument("--compare", metavar="DB", help="size/latency before vs after on a copy of DB")
+    args = ap.parse_args(argv)
+    import db
+    if args.compare:
+        return compare(args.compare)
+    if args.migrate:
+        t0 = time.perf_counter()
+        n = db.encode_log_labels(None if db.DB_URL else db.DB_PATH, args.batch, args.pause_ms, log=print)
+        print(f"{n} rows encoded in {time.perf_counter() - t0:.1f}s")
+        return 0
+    ap.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# loadtest.py — concurrent-session load test of app.py with Streamlit's AppTest
+# Run:
+#   python loadtest.py --sessions 15                      # 15 concurrent nurses, 3 rounds each
+#   python loadtest.py --sessions 15 --out load.json      # machine-readable report
+#   python loadtest.py --sessions 15 --compare load.json  # exit 1 if a step's p95 regressed > --threshold %
+#
+# Every session is one AppTest instance (its own session_state) in its own process: AppTest
+# keeps process-wide runtime state and is not safe to run from several threads at once. The
+# processes start together (after importing Streamlit) and share the SQLite file, so DB
+# contention is that of several app processes; their timings are merged. A session logs in,
+# searches a patient, opens the nurse tab, fills and submits the form, then opens the patient
+# tab (which builds the A4 print). Each AppTest.run() is one rerun and is timed per step.
+#
+# The DB is generated by synth_data.py (like bench.py) and load-test staff accounts
+# load_nurse_<n> are added to it; the app's clinic.db is never touched.
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import secrets
+import sqlite3
+import statistics
+import sys
+import time
+import traceback
+from collections import Counter
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+
+APP = str(Path(__file__).with_name("app.py"))
+PASSWORD = "load-test"
+NURSE_INPUT = {
+    "T_d": "36.8", "BP_d": "120/80", "HR_d": "78", "RR_d": "18", "SpO2_d": "98",
+    "Intake_d": "1500", "Output_d": "1200", "note_day": "load test", "caregiver_d": "load",
+}
+TAB_NURSE = "ทีมพยาบาล (Vitals)"
+TAB_PATIENT = "ข้อมูลคนไข้"
+
+
+def _hash_password(password, iterations=120_000):
+    # same format as app.hash_password (app.py can't be imported outside `streamlit run`)
+    salt = secrets.token_hex(16)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), iterations)
+    return f"pbkdf2${iterations}${salt}${dk.hex()}"
+
+
+def prepare_db(path, patients, days, sessions, rebuild=False):
+    import db
+    import synth_data
+    meta = {"patients": patients, "days": days, "seed": 1}
+    meta_path = path.with_suffix(".meta.json")
+    stale = not path.exists() or not meta_path.exists() or json.loads(meta_path.read_text()) != meta
+    if rebuild or stale:
+        for p in (path, Path(f"{path}-wal"), Path(f"{path}-shm")):
+            p.unlink(missing_ok=True)
+        synth_data.generate(str(path), patients, days, seed=1, end=date.today())
+        meta_path.write_text(json.dumps(meta))
+    db.init_db(str(path))
+    with closing(sqlite3.connect(path)) as conn:
+        have = {r[0] for r in conn.execute("SELECT username FROM staff WHERE username LIKE 'load_nurse_%'")}
+        pw = _hash_password(PASSWORD)
+        conn.executemany(
+            "INSERT INTO staff (name, role, username, password_hash) VALUES (?,?,?,?)",
+            [(f"Load Nurse {i}", "nurse", f"load_nurse_{i}", pw)
+             for i in range(sessions) if f"load_nurse_{i}" not in have],
+        )
+        hns = [r[0] for r in conn.execute("SELECT hn FROM patients WHERE is_active=1 AND hn IS NOT NULL ORDER BY id")]
+        conn.commit()
+    return meta, hns
+
+
+class Session:
+    def __init__(self, n, hns, rounds, timeout):
+        self.n = n
+        self.hns = hns
+        self.rounds = rounds
+        self.timeout = timeout
+        self.timings = []   # (step, ms)
+        self.errors = []    # (step, message)
+
+    def _step(self, name, at):
+        t0 = time.perf_counter()
+        try:
+            at.run(timeout=self.timeout)
+        except Exception as e:  # timeouts and script runner failures
+            self.errors.append((name, f"{type(e).__name__}: {e}"))
+            return False
+        finally:
+            self.timings.append((name, (time.perf_counter() - t0) * 1000.0))
+        if at.exception:
+            self.errors.extend((name, str(ex.value)) for ex in at.exception)
+            return False
+        return True
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+        try:
+            at = AppTest.from_file(APP, default_timeout=self.timeout)
+            if not self._step("open", at):
+                return
+            at.sidebar.text_input[0].input(f"load_nurse_{self.n}")
+            at.sidebar.text_input[1].input(PASSWORD)
+            at.sidebar.button[0].click()
+            if not self._step("login", at):
+                return
+            for r in range(self.rounds):
+                hn = self.hns[(self.n * self.rounds + r) % len(self.hns)]
+                at.sidebar.text_input(key="patient_search").input(hn)
+                next(b for b in at.sidebar.button if b.label == "ค้นหา").click()
+                if not self._step("search", at):
+                    return
+                picks = [b for b in at.sidebar.button if (b.key or "").startswith("pick_")]
+                if not picks:
+                    self.errors.append(("search", f"no result for {hn}"))
+                    return
+                picks[0].click()
+                if not self._step("select_patient", at):
+                    return
+                at.radio(key="active_tab").set_value(TAB_NURSE)
+                if not self._step("nurse_tab", at):
+                    return
+                for key, value in NURSE_INPUT.items():
+                    at.text_input(key=key).input(value)
+                next(b for b in at.button if b.label.startswith("บันทึก (กลางคืน")).click()
+                if not self._step("nurse_submit", at):
+                    return
+                at.radio(key="active_tab").set_value(TAB_PATIENT)
+                if not self._step("print_patient", at):
+                    return
+        except Exception:
+            self.errors.append(("session", traceback.format_exc(limit=3)))
+
+
+def _worker(n, hns, rounds, timeout, barrier, out_q):
+    """One session in its own process -> out_q gets its timings, errors and query counts."""
+    import query_stats
+    importlib.import_module("streamlit.testing.v1")  # import cost stays before the barrier
+    queries, db_errors = Counter(), Counter()
+
+    def on_query(rec):
+        queries[rec["fp"]] += 1
+        if rec.get("error"):
+            db_errors[rec["error"]] += 1
+
+    query_stats.add_listener(on_query)
+    s = Session(n, hns, rounds, timeout)
+    try:
+        barrier.wait(timeout)
+    except Exception:  # a sibling died during startup; run anyway
+        pass
+    t0 = time.time()
+    s.run()
+    out_q.put({"n": n, "start": t0, "end": time.time(), "timings": s.timings, "errors": s.errors,
+               "queries": dict(queries), "db_errors": dict(db_errors)})
+
+
+def run_sessions(hns, sessions, rounds, timeout):
+    """Run `sessions` worker processes concurrently -> (results, wall seconds)."""
+    ctx = multiprocessing.get_context("spawn")
+    barrier, out_q = ctx.Barrier(sessions), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(i, hns, rounds, timeout, barrier, out_q), name=f"load-session-{i}")
+             for i in range(sessions)]
+    for p in procs:
+        p.start()
+    results = {}
+    while len(results) < sessions:
+        try:
+            r = out_q.get(timeout=1.0)
+        except queue.Empty:
+            if any(p.is_alive() for p in procs):
+                continue
+            try:  # everyone exited: whatever they sent is in the pipe by now
+                r = out_q.get(timeout=1.0)
+            except queue.Empty:
+                break
+        results[r["n"]] = r
+    for p in procs:
+        p.join()
+    for i, p in enumerate(procs):
+        if i not in results:  # crashed before reporting
+            results[i] = {"n": i, "start": None, "end": None, "timings": [], "queries": {}, "db_errors": {},
+                          "errors": [("session", f"worker process exited with code {p.exitcode}")]}
+    results = [results[i] for i in range(sessions)]
+    starts = [r["start"] for r in results if r["start"]]
+    ends = [r["end"] for r in results if r["end"]]
+    return results, (max(ends) - min(starts) if starts else 0.0)
+
+
+def _pct(vals, q):
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+
+def _stats(vals):
+    vals = sorted(vals)
+    if not vals:
+        return {"count": 0}
+    return {
+        "count": len(vals),
+        "p50_ms": round(_pct(vals, 0.5), 1),
+        "p95_ms": round(_pct(vals, 0.95), 1),
+        "p99_ms": round(_pct(vals, 0.99), 1),
+        "max_ms": round(vals[-1], 1),
+        "mean_ms": round(statistics.fmean(vals), 1),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Concurrent-session load test of app.py (Streamlit AppTest)")
+    ap.add_argument("--db", default="/tmp/hh_load.db")
+    ap.add_argument("--patients", type=int, default=200)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--rebuild", action="store_true", help="regenerate the synthetic DB")
+    ap.add_argument("--sessions", type=int, default=10, help="concurrent sessions")
+    ap.add_argument("--rounds", type=int, default=3, help="search/fill/submit/print rounds per session")
+    ap.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per rerun")
+    ap.add_argument("--out", help="write the JSON report here")
+    ap.add_argument("--compare", help="compare step p95 with an earlier report")
+    ap.add_argument("--threshold", type=float, default=25.0, help="allowed p95 regression in %% for --compare")
+    args = ap.parse_args(argv)
+
+    path = Path(args.db)
+    # the app reads these at import time; keep the load test's side files out of the app dir
+    os.environ["HH_DB_PATH"] = str(path)
+    os.environ.setdefault("HH_METRICS_FILE", "")
+    os.environ.setdefault("HH_BACKUP_INTERVAL_MIN", "0")
+    os.environ.setdefault("HH_SLOW_QUERY_LOG", str(path.with_suffix(".slow.jsonl")))
+    meta, hns = prepare_db(path, args.patients, args.days, args.sessions, args.rebuild)
+
+    import db_writer
+    import streamlit
+
+    sessions, wall = run_sessions(hns, args.sessions, args.rounds, args.timeout)
+    queries, db_errors = Counter(), Counter()
+    by_step = {}
+    for s in sessions:
+        queries.update(s["queries"])
+        db_errors.update(s["db_errors"])
+        for step, ms in s["timings"]:
+            by_step.setdefault(step, []).append(ms)
+    all_ms = [ms for v in by_step.values() for ms in v]
+    errors = [(step, msg) for s in sessions for step, msg in s["errors"]]
+    lock_errors = sum(n for e, n in db_errors.items() if "locked" in e or "busy" in e) \
+        + sum(1 for _, msg in errors if "locked" in msg or "busy" in msg)
+    n_queries = sum(queries.values())
+    report = {
+        "meta": {
+            "data": meta, "sessions": args.sessions, "rounds": args.rounds,
+            "db_writer": db_writer.ENABLED, "python": platform.python_version(),
+            "streamlit": streamlit.__version__, "sqlite": sqlite3.sqlite_version, "machine": platform.machine(),
+        },
+        "wall_s": round(wall, 2),
+        "reruns": len(all_ms),
+        "reruns_per_s": round(len(all_ms) / wall, 2) if wall else 0,
+        "rerun": _stats(all_ms),
+        "steps": {k: _stats(v) for k, v in by_step.items()},
+        "queries": {
+            "total": n_queries,
+            "per_rerun": round(n_queries / len(all_ms), 1) if all_ms else 0,
+            "top": [{"fp": fp[:200], "n": n} for fp, n in queries.most_common(10)],
+        },
+        "errors": {
+            "lock": lock_errors,
+            "db": sum(db_errors.values()),
+            "sessions_failed": sum(1 for s in sessions if s["errors"]),
+            "samples": [f"{step}: {msg[:300]}" for step, msg in errors[:10]],
+        },
+    }
+
+    print(f"{args.sessions} sessions x {args.rounds} rounds: {len(all_ms)} reruns in {wall:.1f}s "
+          f"({report['reruns_per_s']}/s), {n_queries} queries ({report['queries']['per_rerun']}/rerun), "
+          f"{lock_errors} lock errors, {report['errors']['sessions_failed']} failed sessions")
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    regressions = []
+    print(f"{'step':16} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}" + ("  p95 vs baseline" if baseline else ""))
+    for step, s in report["steps"].items():
+        line = f"{step:16} {s['count']:5d} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f} {s['max_ms']:9.1f}"
+        base = (baseline or {}).get("steps", {}).get(step)
+        if base:
+            delta = (s["p95_ms"] - base["p95_ms"]) / max(base["p95_ms"], 1e-9) * 100.0
+            line += f"  {delta:+7.1f}%"
+            if delta > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(step)
+        print(line)
+    for sample in report["errors"]["samples"]:
+        print("  error:", sample)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"report written to {args.out}")
+    if baseline and baseline.get("meta", {}).get("sessions") != args.sessions:
+        print(f"warning: baseline ran {baseline.get('meta', {}).get('sessions')} sessions, now {args.sessions}")
+    if regressions or report["errors"]["sessions_failed"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# migrate_legacy.py — move the legacy vitals / physio_sessions tables into nurse_logs / physio_logs
+# Before the logs existed the nurse and physio forms wrote one wide row per entry into
+# `vitals` and `physio_sessions`. init_db no longer creates them, but older clinic.db files
+# still hold years of records there that the tabs, prints, API and change feed never see.
+# Each legacy row becomes one log row per non-empty column, under the current form labels
+# (form_defs.LEGACY_VITALS_COLUMNS / LEGACY_PHYSIO_COLUMNS), keeping its ts and created_at.
+#
+# Rows are read in id order, --batch at a time. A batch's log rows and the legacy id it
+# reached are committed in one transaction (legacy_migration), so a run that dies resumes
+# after the last committed batch and never writes a row twice. Legacy tables are not changed.
+#
+# Run:
+#   python migrate_legacy.py                 # migrate both tables, or resume
+#   python migrate_legacy.py --dry-run       # count the log rows it would write
+#   python migrate_legacy.py --status        # progress per table
+#
+# SQLite only (HH_DB_PATH): the legacy tables never existed on PostgreSQL.
+import argparse
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import datetime
+
+import db
+import db_writer
+import labels
+from form_defs import (LEGACY_PHYSIO_COLUMNS, LEGACY_PHYSIO_TYPE, LEGACY_VITALS_COLUMNS, NURSE_FIELDS,
+                       PHYSIO_FIELDS, SHIFT_ALIASES)
+from shift_helpers import DAY_START, NIGHT_START, care_day, shift_of
+
+BATCH = 2000
+PAUSE_MS = 20.0
+
+CHECKPOINT_SQL = """
+CREATE TABLE IF NOT EXISTS legacy_migration (
+    tbl TEXT PRIMARY KEY,                   -- legacy table
+    last_id INTEGER NOT NULL DEFAULT 0,     -- highest legacy id already written to the logs
+    rows_read INTEGER NOT NULL DEFAULT 0,
+    rows_written INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+"""
+
+NURSE_LABELS = {key: (sec, fld) for key, _, sec, fld in NURSE_FIELDS}
+PHYSIO_LABELS = {key: (sec, fld) for key, types, sec, fld in PHYSIO_FIELDS if LEGACY_PHYSIO_TYPE in types}
+
+NURSE_SQL = ("INSERT INTO nurse_logs (patient_id, hn, ts, shift, section, field, section_id, field_id, value, "
+             "created_by_id, care_day, created_at) VALUES (?,?,?,?,'','',?,?,?,?,?,COALESCE(?, datetime('now')))")
+PHYSIO_SQL = ("INSERT INTO physio_logs (patient_id, log_date, physio_type, section, field, section_id, field_id, "
+              "value, created_by_id, created_at) VALUES (?,?,?,'','',?,?,?,?,COALESCE(?, datetime('now')))")
+
+
+def _text(v):
+    return "" if v is None else str(v).strip()
+
+
+def _ts(r, shift):
+    """'YYYY-MM-DD HH:MM' of a legacy vitals row; a bare date gets the start of its shift."""
+    s = _text(r.get("ts")).replace("T", " ")[:16]
+    if len(s) == 10:
+        s += f" {NIGHT_START if shift == 'night' else DAY_START:%H:%M}"
+    datetime.strptime(s, "%Y-%m-%d %H:%M")  # ValueError -> row skipped
+    return s
+
+
+def vitals_rows(r, lab, rq, hn_of):
+    """NURSE_SQL params for one legacy vitals row (one per non-empty column)."""
+    shift = SHIFT_ALIASES.get(_text(r.get("shift")).lower())
+    ts = _ts(r, shift)
+    shift = shift or shift_of(datetime.strptime(ts[11:16], "%H:%M").time())
+    day = care_day(ts).isoformat()
+    who = lab.id(rq, _text(r.get("created_by")))
+    out = []
+    for col, (day_key, night_key) in LEGACY_VITALS_COLUMNS.items():
+        value = _text(r.get(col))
+        if not value:
+            continue
+        sec, fld = NURSE_LABELS[day_key if shift == "day" else night_key]
+        out.append((r["patient_id"], hn_of.get(r["patient_id"]), ts, shift, lab.id(rq, sec), lab.id(rq, fld),
+                    value, who, day, r.get("created_at")))
+    return out
+
+
+def physio_columns(conn):
+    """physio_sessions column -> basic-form widget key, for the columns this file actually has."""
+    cols = [row[1] for row in conn.execute("PRAGMA table_info(physio_sessions)")]
+    return {c: LEGACY_PHYSIO_COLUMNS.get(c, c) for c in cols if LEGACY_PHYSIO_COLUMNS.get(c, c) in PHYSIO_LABELS}
+
+
+def physio_rows(r, lab, rq, cols):
+    """PHYSIO_SQL params for one legacy physio_sessions row (one per non-empty column)."""
+    day = (_text(r.get("session_date")) or _text(r.get("created_at")))[:10]
+    datetime.strptime(day, "%Y-%m-%d")
+    who = lab.id(rq, _text(r.get("created_by")))
+    out = []
+    for col, key in cols.items():
+        value = _text(r.get(col))
+        if not value:
+            continue
+        sec, fld = PHYSIO_LABELS[key]
+        out.append((r["patient_id"], day, LEGACY_PHYSIO_TYPE, lab.id(rq, sec), lab.id(rq, fld),
+                    value, who, r.get("created_at")))
+    return out
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+
+def migrate_table(conn, tbl, convert, sql, batch=BATCH, pause_ms=PAUSE_MS, dry_run=False, log=print):
+    """Copy legacy rows after the checkpoint into the logs, one transaction per batch
+    -> (legacy rows read, log rows written, legacy rows skipped)."""
+    conn.execute("INSERT INTO legacy_migration (tbl) VALUES (?) ON CONFLICT(tbl) DO NOTHING", (tbl,))
+    last_id = conn.execute("SELECT last_id FROM legacy_migration WHERE tbl=?", (tbl,)).fetchone()[0]
+    rq = labels.conn_query(conn)
+    lab = labels.LabelDict().load(rq)
+    read = written = skipped = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(f"SELECT * FROM {tbl} WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch))
+            names = [d[0] for d in cur.description]
+            rows = [dict(zip(names, r)) for r in cur.fetchall()]
+            if not rows:
+                conn.execute("ROLLBACK")
+                break
+            params = []
+            for r in rows:
+                try:
+                    params += convert(r, lab, rq)
+                except ValueError:
+                    skipped += 1
+            if params:
+                conn.executemany(sql, params)
+            last_id = rows[-1]["id"]
+            conn.execute(
+                "UPDATE legacy_migration SET last_id=?, rows_read=rows_read+?, rows_written=rows_written+?, "
+                "updated_at=datetime('now') WHERE tbl=?",
+                (last_id, len(rows), len(params), tbl),
+            )
+            conn.execute("ROLLBACK" if dry_run else "COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        read += len(rows)
+        written += len(params)
+        log(f"{tbl}: up to id {last_id}, {read} rows read, {written} log rows {'would be ' if dry_run else ''}written")
+        if pause_ms:
+            time.sleep(pause_ms / 1000.0)
+    return read, written, skipped
+
+
+def migrate(db_path, batch=BATCH, pause_ms=PAUSE_MS, dry_run=False, log=print):
+    """Migrate (or resume) both legacy tables -> {legacy table: (read, written, skipped)}."""
+    out = {}
+    with closing(sqlite3.connect(db_path, timeout=db_writer.BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)) as conn:
+        conn.execute(f"PRAGMA busy_timeout={db_writer.BUSY_TIMEOUT_MS}")
+        conn.executescript(CHECKPOINT_SQL)
+        hn_of = dict(conn.execute("SELECT id, hn FROM patients").fetchall())
+        if _has_table(conn, "vitals"):
+            out["vitals"] = migrate_table(
+                conn, "vitals", lambda r, lab, rq: vitals_rows(r, lab, rq, hn_of), NURSE_SQL,
+                batch, pause_ms, dry_run, log)
+        if _has_table(conn, "physio_sessions"):
+            cols = physio_columns(conn)
+            out["physio_sessions"] = migrate_table(
+                conn, "physio_sessions", lambda r, lab, rq: physio_rows(r, lab, rq, cols), PHYSIO_SQL,
+                batch, pause_ms, dry_run, log)
+    return out
+
+
+def status(db_path):
+    """Checkpoint and remaining legacy rows per table -> list of dicts."""
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.executescript(CHECKPOINT_SQL)
+        out = []
+        for tbl in ("vitals", "physio_sessions"):
+            if not _has_table(conn, tbl):
+                continue
+            row = conn.execute("SELECT last_id, rows_read, rows_written, updated_at FROM legacy_migration WHERE tbl=?",
+                               (tbl,)).fetchone() or (0, 0, 0, None)
+            left = conn.execute(f"SELECT COUNT(*) FROM {tbl} WHERE id > ?", (row[0],)).fetchone()[0]
+            out.append({"tbl": tbl, "last_id": row[0], "rows_read": row[1], "rows_written": row[2],
+                        "updated_at": row[3], "remaining": left})
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Move legacy vitals / physio_sessions rows into nurse_logs / physio_logs")
+    ap.add_argument("--db", default=db.DB_PATH)
+    ap.add_argument("--batch", type=int, default=BATCH, help="legacy rows per transaction")
+    ap.add_argument("--pause-ms", type=float, default=PAUSE_MS, help="pause between batches")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--status", action="store_true", help="print progress and exit")
+    args = ap.parse_args(argv)
+
+    if db.DB_URL:
+        print("migrate_legacy.py works on the SQLite file; PostgreSQL never had the legacy tables", file=sys.stderr)
+        return 2
+    db.DB_PATH = args.db
+    db.init_db(args.db)
+    if args.status:
+        for s in status(args.db):
+            print(f"{s['tbl']}: up to id {s['last_id']} ({s['rows_read']} read, {s['rows_written']} log rows), "
+                  f"{s['remaining']} left" + (f", last batch {s['updated_at']}" if s["updated_at"] else ""))
+        return 0
+    t0 = time.perf_counter()
+    out = migrate(args.db, args.batch, args.pause_ms, args.dry_run)
+    if not out:
+        print("no legacy tables in " + args.db)
+        return 0
+    print(", ".join(f"{t}: {r} read, {w} log rows, {s} skipped" for t, (r, w, s) in out.items())
+          + f" in {time.perf_counter() - t0:.1f}s" + (" (dry run)" if args.dry_run else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# perf.py — section-level render timing and slow-rerun profiling for app.py
+# Usage:
+#   with perf.section("tab.nurse"): ...        # or  @perf.timed("banner") on a function
+#
+# Durations are aggregated per section (p50/p95 over the last samples, count and sum) and
+# written periodically to a Prometheus text-format file that node_exporter's textfile
+# collector (or anything that can read a file) can scrape.
+#
+# Env:
+#   HH_METRICS_FILE      output file (default metrics.prom, empty disables)
+#   HH_METRICS_INTERVAL  min seconds between writes (default 10)
+#   HH_PROFILE           'cprofile' or 'tracemalloc' to capture slow reruns (default off)
+#   HH_PROFILE_SLOW_MS   rerun duration that triggers a dump (default 1000)
+#   HH_PROFILE_DIR       where dumps go (default profiles/)
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+from pathlib import Path
+
+METRICS_FILE = os.getenv("HH_METRICS_FILE", "metrics.prom")
+METRICS_INTERVAL = float(os.getenv("HH_METRICS_INTERVAL", "10") or 10)
+PROFILE_MODE = os.getenv("HH_PROFILE", "").strip().lower()
+PROFILE_SLOW_MS = float(os.getenv("HH_PROFILE_SLOW_MS", "1000") or 1000)
+PROFILE_DIR = Path(os.getenv("HH_PROFILE_DIR", "profiles"))
+SAMPLES_KEPT = 2048
+
+_lock = threading.Lock()
+_samples = {}   # section -> deque of seconds (recent window for quantiles)
+_totals = {}    # section -> [count, sum seconds] since process start
+_counters = {}  # name -> value
+_last_write = 0.0
+_local = threading.local()
+
+
+def observe(name, seconds):
+    with _lock:
+        dq = _samples.get(name)
+        if dq is None:
+            dq = _samples[name] = deque(maxlen=SAMPLES_KEPT)
+            _totals[name] = [0, 0.0]
+        dq.append(seconds)
+        t = _totals[name]
+        t[0] += 1
+        t[1] += seconds
+
+
+class section(ContextDecorator):
+    """Time a block (context manager) or a function (decorator) under a section name."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _recreate_cm(self):
+        # as a decorator the instance is shared by every call (threads, recursion):
+        # give each call its own start time
+        return section(self.name)
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self._t0)
+        return False
+
+
+timed = section
+
+
+def incr(name, n=1):
+    """Add n to a monotonically increasing counter exported with the section metrics."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def _quantile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))]
+
+
+def snapshot():
+    """{section: {"p50", "p95", "count", "sum"}} in seconds."""
+    with _lock:
+        items = [(k, sorted(v), list(_totals[k])) for k, v in _samples.items()]
+    return {
+        k: {"p50": _quantile(v, 0.5), "p95": _quantile(v, 0.95), "count": t[0], "sum": t[1]}
+        for k, v, t in items
+    }
+
+
+def prometheus_text():
+    lines = [
+        "# HELP hh_section_seconds Render time of app.py sections per rerun.",
+        "# TYPE hh_section_seconds summary",
+    ]
+    for name, s in sorted(snapshot().items()):
+        lbl = name.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'hh_section_seconds{{section="{lbl}",quantile="0.5"}} {s["p50"]:.6f}')
+        lines.append(f'hh_section_seconds{{section="{lbl}",quantile="0.95"}} {s["p95"]:.6f}')
+        lines.append(f'hh_section_seconds_count{{section="{lbl}"}} {s["count"]}')
+        lines.append(f'hh_section_seconds_sum{{section="{lbl}"}} {s["sum"]:.6f}')
+    with _lock:
+        counters = sorted(_counters.items())
+    for name, v in counters:
+        metric = "hh_" + "".join(c if c.isalnum() else "_" for c in name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {v}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(force=False):
+    global _last_write
+    if not METRICS_FILE:
+        return
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _last_write < METRICS_INTERVAL:
+            return
+        _last_write = now
+    tmp = f"{METRICS_FILE}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp, METRICS_FILE)
+    except OSError:
+        pass
+
+
+# ---------------- Rerun lifecycle + profiling ----------------
+def begin_rerun():
+    _local.t0 = time.perf_counter()
+    _local.profiler = None
+    if PROFILE_MODE == "cprofile":
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+            _local.profiler = prof
+        except ValueError:
+            # another profiler is active in this thread
+            pass
+    elif PROFILE_MODE == "tracemalloc":
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+
+def end_rerun():
+    t0 = getattr(_local, "t0", None)
+    if t0 is None:
+        return
+    _local.t0 = None
+    elapsed = time.perf_counter() - t0
+    observe("rerun", elapsed)
+    prof = getattr(_local, "profiler", None)
+    if prof is not None:
+        prof.disable()
+        _local.profiler = None
+    if PROFILE_MODE and elapsed * 1000.0 >= PROFILE_SLOW_MS:
+        _dump_profile(prof, elapsed)
+    write_metrics()
+
+
+def _dump_profile(prof, elapsed):
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stem = PROFILE_DIR / f"rerun_{time.strftime('%Y%m%d_%H%M%S')}_{threading.get_ident()}_{int(elapsed * 1000)}ms"
+        if prof is not None:
+            prof.dump_stats(f"{stem}.prof")
+        elif PROFILE_MODE == "tracemalloc":
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                tracemalloc.take_snapshot().dump(f"{stem}.tracemalloc")
+    except OSError:
+        pass
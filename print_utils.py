@@ -3,6 +3,8 @@ import base64
 from datetime import datetime, date
 from pathlib import Path
 
+import labels
+
 def _logo_base64(get_logo_path):
     lp = get_logo_path()
     if not lp or not Path(lp).exists(): 
@@ -84,17 +86,21 @@ def _header_html(get_logo_path, doc_title:str):
     return f"<div class='header'>{img_html}{lines}<div class='title'>{doc_title}</div></div>"
 
 def build_vitals_print_html(run_query, get_logo_path, calc_age_ymd, pid:int, selected_date:str):
+    """Daily vitals sheet in the layout of the old `vitals` table, one line per shift, read from
+    the same rows as the nurse form (migrate_legacy.py moved the old table into nurse_logs)."""
+    from form_defs import NURSE_FIELDS, LEGACY_VITALS_COLUMNS
     _, banner_html = _patient_banner_rows(run_query, calc_age_ymd, pid)
-    rows = run_query(
-        "SELECT ts,shift,temperature,bp,heart_rate,resp_rate,spo2,dtx,intake_ml,output_times,stool,note,caregiver_name,head_nurse_name,created_by FROM vitals WHERE patient_id=? AND date(ts)=? ORDER BY ts ASC",
-        (pid, selected_date), fetch=True
-    ) or []
-    night = []; day = []
-    for r in rows:
-        try: h = int(r['ts'][11:13])
-        except Exception: h = 0
-        if 7 <= h < 19: day.append(r)
-        else: night.append(r)
+    key_of = {(sh, sec, fld): key for key, sh, sec, fld in NURSE_FIELDS}
+    col_of = {key: col for col, keys in LEGACY_VITALS_COLUMNS.items() for key in keys}
+    by_shift = {}
+    for r in _nurse_day_rows(run_query, pid, selected_date):
+        col = col_of.get(key_of.get((r['shift'], r['section'], r['field'])))
+        if col:
+            line = by_shift.setdefault(r['shift'], {"ts": ""})
+            line[col] = r['value']
+            line["ts"] = max(line["ts"], r['ts'] or "")
+    night = [by_shift["night"]] if "night" in by_shift else []
+    day = [by_shift["day"]] if "day" in by_shift else []
     def _rows_to_table(rs):
         if not rs: return "<div class='muted'>ไม่มีข้อมูล</div>"
         th = "<tr><th>เวลา</th><th>Temp</th><th>BP</th><th>HR</th><th>RR</th><th>SpO₂</th><th>DTX</th><th>น้ำเข้า (ml)</th><th>ปัสสาวะ (ครั้ง)</th><th>อุจจาระ</th><th>บันทึก</th></tr>"
@@ -124,20 +130,20 @@ def build_vitals_print_html(run_query, get_logo_path, calc_age_ymd, pid:int, sel
     return html
 
 def build_physio_print_html(run_query, get_logo_path, calc_age_ymd, pid:int, selected_date:str):
+    """Daily physio sheet in the layout of the old `physio_sessions` table, one block per physio
+    type, read from the same rows as the physio form."""
     _, banner_html = _patient_banner_rows(run_query, calc_age_ymd, pid)
-    rows = run_query(
-        "SELECT * FROM physio_sessions WHERE patient_id=? AND date(session_date)=? ORDER BY created_at ASC",
-        (pid, selected_date), fetch=True
-    ) or []
+    rows = {}
+    for r in _physio_day_rows(run_query, pid, selected_date):
+        block = rows.setdefault(r['physio_type'], {"ประเภท": _PHYSIO_TITLES.get(r['physio_type'], r['physio_type'])})
+        block[f"{r['section']} {r['field']}"] = r['value']
+    rows = list(rows.values())
     def _block_from_row(r):
         items=[]
         for k,v in r.items():
-            if k in ('id','patient_id','created_by','created_at'): 
-                continue
             if v in (None,""):
                 continue
-            kk = k.replace('_',' ')
-            items.append(f"<tr><td style='width:30%'><strong>{kk}</strong></td><td>{v}</td></tr>")
+            items.append(f"<tr><td style='width:30%'><strong>{k}</strong></td><td>{v}</td></tr>")
         if not items:
             return ""
         return "<table class='tbl'>" + "".join(items) + "</table>"
@@ -237,14 +243,31 @@ def build_patient_inputlike_print_html(run_query, get_logo_path, calc_age_ymd, p
         html += "<div class='muted'>ไม่มีข้อมูลผู้ป่วย</div>"
     return html + "</body></html>"
 
+def _nurse_day_rows(run_query, pid:int, selected_date:str):
+    """Nurse rows of one care day as {ts, shift, section, field, value, created_by}: the latest
+    snapshot per shift (one row each); shifts without one are listed from nurse_logs, oldest first."""
+    from form_defs import NURSE_FIELDS
+    from queries import latest_snapshots
+    snaps = latest_snapshots(run_query, pid, "nurse", selected_date)
+    rows = []
+    for shift, snap in snaps.items():
+        if snap:
+            rows += [{"ts": snap["ts"] or "", "shift": shift, "section": sec, "field": fld,
+                      "value": snap["values"][key], "created_by": snap["created_by"]}
+                     for key, sh, sec, fld in NURSE_FIELDS if sh == shift and key in snap["values"]]
+    if None in snaps.values():
+        rows += [r for r in labels.decode(run_query, run_query(
+            "SELECT ts,shift,section,field,value,created_by,section_id,field_id,created_by_id FROM nurse_logs "
+            "WHERE patient_id=? AND care_day=? ORDER BY ts ASC, id ASC",
+            (pid, selected_date), fetch=True
+        ) or []) if snaps.get(r['shift']) is None]
+    return rows
+
 def build_vitals_inputlike_print_html(run_query, get_logo_path, calc_age_ymd, pid:int, selected_date:str):
     _, banner = _patient_banner_rows(run_query, calc_age_ymd, pid)
     html = "<html><head>"+_base_css()+"</head><body>" + _header_html(get_logo_path, "ทีมพยาบาล — ฟอร์มรวม Night+Day")
     html += f"<div class='muted'>วันที่: {selected_date}</div>" + banner
-    rows = run_query(
-        "SELECT ts,shift,section,field,value,created_by FROM nurse_logs WHERE patient_id=? AND date(ts)=? ORDER BY ts ASC, id ASC",
-        (pid, selected_date), fetch=True
-    ) or []
+    rows = _nurse_day_rows(run_query, pid, selected_date)
     if not rows:
         html += "<div class='muted'>ไม่มีข้อมูล</div></body></html>"
         return html
@@ -259,14 +282,28 @@ def build_vitals_inputlike_print_html(run_query, get_logo_path, calc_age_ymd, pi
     html += "<div class='section'><h3>ช่วงกลางวัน (07:00–19:00)</h3>"+mk_tbl(day)+"</div>"
     return html + "</body></html>"
 
+def _physio_day_rows(run_query, pid:int, selected_date:str):
+    """Physio rows of one day as {physio_type, section, field, value}: the latest snapshot per
+    physio type; types without one are listed from physio_logs, oldest first."""
+    from form_defs import PHYSIO_FIELDS
+    from queries import latest_snapshots
+    snaps = latest_snapshots(run_query, pid, "physio", selected_date)
+    rows = [{"physio_type": ptype, "section": sec, "field": fld, "value": snap["values"][key]}
+            for ptype, snap in snaps.items() if snap
+            for key, types, sec, fld in PHYSIO_FIELDS if ptype in types and key in snap["values"]]
+    if None in snaps.values():
+        rows += [r for r in labels.decode(run_query, run_query(
+            "SELECT physio_type, section, field, value, created_by, section_id, field_id, created_by_id FROM physio_logs "
+            "WHERE patient_id=? AND log_date=? ORDER BY id ASC",
+            (pid, selected_date), fetch=True
+        ) or []) if snaps.get(r['physio_type']) is None]
+    return rows
+
 def build_physio_inputlike_print_html(run_query, get_logo_path, calc_age_ymd, pid:int, selected_date:str):
     _, banner = _patient_banner_rows(run_query, calc_age_ymd, pid)
     html = "<html><head>"+_base_css()+"</head><body>" + _header_html(get_logo_path, "ทีมกายภาพ — แบบฟอร์มตามที่บันทึก")
     html += f"<div class='muted'>วันที่: {selected_date}</div>" + banner
-    rows = run_query(
-        "SELECT physio_type, section, field, value, created_by FROM physio_logs WHERE patient_id=? AND log_date=? ORDER BY id ASC",
-        (pid, selected_date), fetch=True
-    ) or []
+    rows = _physio_day_rows(run_query, pid, selected_date)
     if not rows:
         html += "<div class='muted'>ไม่มีข้อมูล</div></body></html>"
         return html
@@ -281,3 +318,130 @@ def build_physio_inputlike_print_html(run_query, get_logo_path, calc_age_ymd, pi
             html += f"<tr><td>{it['field']}</td><td>{it['value'] or ''}</td></tr>"
         html += "</table></div>"
     return html + "</body></html>"
+
+def build_pick_list_print_html(run_query, get_logo_path, meal_slot:str, timing, selected_date:str, rows=None):
+    """Facility-wide pharmacy pick list for one meal slot (rows may be passed in from a cache)."""
+    if rows is None:
+        from queries import pharmacy_pick_list
+        rows = pharmacy_pick_list(run_query, meal_slot, timing)
+    title = f"ใบจัดยา — มื้อ{meal_slot}" + (f" ({timing})" if timing else "")
+    html = "<html><head>"+_base_css()+"</head><body>" + _header_html(get_logo_path, title)
+    html += f"<div class='muted'>วันที่: {selected_date}</div>"
+    if not rows:
+        return html + "<div class='muted'>ไม่มีรายการยา</div></body></html>"
+    from itertools import groupby
+    for ward, items in groupby(rows, key=lambda r: r['ward']):
+        items = list(items)
+        html += f"<div class='section'><h3>วอร์ด {ward} — {sum(r['doses'] for r in items)} โดส</h3><table class='tbl'>"
+        html += "<tr><th>ชื่อยา</th><th>ประเภท</th><th>เวลา</th><th>จำนวน</th><th>ผู้ป่วย</th><th>จัดแล้ว</th></tr>"
+        for r in items:
+            html += f"<tr><td>{r['drug_name']}</td><td>{r['drug_type'] or ''}</td><td>{r['timing'] or ''}</td><td>{r['doses']}</td><td>{r['patients'] or ''}</td><td>☐</td></tr>"
+        html += "</table></div>"
+    return html + "</body></html>"
+
+# ---------------- Discharge / transfer report (date range) ----------------
+_SHIFT_TITLES = {"day": "เวรกลางวัน (07:00–19:00)", "night": "เวรกลางคืน (19:00–07:00)"}
+_PHYSIO_TITLES = {"basic": "กายภาพพื้นฐาน", "rehab": "กายภาพฟื้นฟู"}
+
+def _latest_per_field(run_query, rows, order):
+    """Newest row (highest id, as in queries._nurse_from_logs) per section / field of one shift /
+    physio type, decoded (text and id rows of a not yet migrated DB share a key), in form order."""
+    latest = {}
+    for r in labels.decode(run_query, list(rows)):
+        key = (r['section'], r['field'])
+        if key not in latest or r['id'] > latest[key]['id']:
+            latest[key] = r
+    return sorted(latest.values(), key=lambda r: order.get((r['section'], r['field']), len(order)))
+
+def _nurse_blocks(run_query, iter_query, pid, start, end):
+    """(day, 0, title, rows) per care day and shift, from one ordered nurse_logs read."""
+    from itertools import groupby
+    from form_defs import NURSE_FIELDS
+    order = {(sec, fld): i for i, (_, _, sec, fld) in enumerate(NURSE_FIELDS)}
+    # ORDER BY follows idx_nurse_logs_care_day, so rows arrive grouped without a sort
+    rows = iter_query(
+        "SELECT id, care_day, shift, section_id, field_id, section, field, value, ts, created_by, created_by_id "
+        "FROM nurse_logs WHERE patient_id=? AND care_day BETWEEN ? AND ? "
+        "ORDER BY care_day, shift, section_id, field_id, ts, id",
+        (pid, start, end)
+    )
+    for (day, shift), rs in groupby(rows, key=lambda r: (r['care_day'], r['shift'])):
+        yield day, 0, "ทีมพยาบาล — " + _SHIFT_TITLES.get(shift, shift or ""), _latest_per_field(run_query, rs, order)
+
+def _physio_blocks(run_query, iter_query, pid, start, end):
+    """(day, 1, title, rows) per day and physio type, from one ordered physio_logs read."""
+    from itertools import groupby
+    from form_defs import PHYSIO_FIELDS
+    order = {(sec, fld): i for i, (_, _, sec, fld) in enumerate(PHYSIO_FIELDS)}
+    rows = iter_query(
+        "SELECT id, log_date, physio_type, section_id, field_id, section, field, value, created_by, created_by_id "
+        "FROM physio_logs WHERE patient_id=? AND log_date BETWEEN ? AND ? "
+        "ORDER BY log_date, physio_type, section_id, field_id, id",
+        (pid, start, end)
+    )
+    for (day, ptype), rs in groupby(rows, key=lambda r: (r['log_date'], r['physio_type'])):
+        yield day, 1, "ทีมกายภาพ — " + _PHYSIO_TITLES.get(ptype, ptype or ""), _latest_per_field(run_query, rs, order)
+
+def _block_html(title, rows):
+    th = "<tr><th>หัวข้อ</th><th>ฟิลด์</th><th>ค่า</th><th>ผู้บันทึก</th></tr>"
+    trs = "".join(f"<tr><td>{r['section'] or ''}</td><td>{r['field'] or ''}</td><td>{r['value'] or ''}</td><td>{r.get('created_by') or ''}</td></tr>" for r in rows)
+    return f"<div class='section'><h3>{title}</h3><table class='tbl'>{th}{trs}</table></div>"
+
+def _meds_html(iter_query, pid, start, end):
+    """Medications taken at some point in the range, one streamed read, oldest start first."""
+    yield "<div class='section'><h2>รายการยาในช่วงเวลา</h2><table class='tbl'>"
+    yield "<tr><th>ชื่อยา</th><th>ประเภท</th><th>วิธีรับประทาน</th><th>มื้อ</th><th>เริ่ม</th><th>หยุด</th><th>หมายเหตุ</th></tr>"
+    n = 0
+    for r in iter_query(
+        "SELECT drug_name, drug_type, how_to, meal_times, timing_radio, start_date, inactive_date, active, note, created_at "
+        "FROM medications WHERE patient_id=? "
+        "AND COALESCE(NULLIF(start_date,''), substr(created_at,1,10)) <= ? "
+        "AND (COALESCE(active,1)=1 OR COALESCE(inactive_date,'') = '' OR inactive_date >= ?) "
+        "ORDER BY COALESCE(NULLIF(start_date,''), substr(created_at,1,10)), id",
+        (pid, end, start)
+    ):
+        n += 1
+        stop = (r.get('inactive_date') or "") if r.get('active') == 0 else ""
+        started = r.get('start_date') or (r.get('created_at') or "")[:10]
+        yield (f"<tr><td>{r.get('drug_name') or ''}</td><td>{r.get('drug_type') or ''}</td><td>{r.get('how_to') or ''}</td>"
+               f"<td>{r.get('meal_times') or ''} {r.get('timing_radio') or ''}</td><td>{started}</td><td>{stop}</td><td>{r.get('note') or ''}</td></tr>")
+    if not n:
+        yield "<tr><td colspan='7' class='muted'>ไม่มีข้อมูล</td></tr>"
+    yield "</table></div>"
+
+def iter_discharge_report_html(run_query, iter_query, get_logo_path, calc_age_ymd, pid:int, start:str, end:str):
+    """HTML chunks of the nurse, physio and medication records of pid from start to end (ISO
+    dates, inclusive), grouped by day, then shift / physio type (latest value per field).
+    One ordered iter_query per table; only one shift's rows are held at a time."""
+    import heapq
+    from itertools import groupby
+    _, banner = _patient_banner_rows(run_query, calc_age_ymd, pid)
+    yield "<html><head>" + _base_css() + "</head><body>"
+    yield _header_html(get_logo_path, "สรุปบันทึกการดูแล (จำหน่าย/ส่งต่อ)")
+    yield f"<div class='muted'>ช่วงวันที่: {start} ถึง {end}</div>" + banner
+    blocks = heapq.merge(_nurse_blocks(run_query, iter_query, pid, start, end),
+                         _physio_blocks(run_query, iter_query, pid, start, end),
+                         key=lambda b: (b[0], b[1]))
+    days = 0
+    for day, items in groupby(blocks, key=lambda b: b[0]):
+        days += 1
+        yield f"<h2 style='page-break-before:{'always' if days > 1 else 'auto'}'>วันที่ {day}</h2>"
+        for _, _, title, rows in items:
+            yield _block_html(title, rows)
+    if not days:
+        yield "<div class='muted'>ไม่มีบันทึกพยาบาล/กายภาพในช่วงนี้</div>"
+    yield from _meds_html(iter_query, pid, start, end)
+    yield "</body></html>"
+
+def write_discharge_report_html(run_query, iter_query, get_logo_path, calc_age_ymd, pid:int, start:str, end:str, out_path=None):
+    """Write iter_discharge_report_html to out_path (default: a new temp file) -> path."""
+    import tempfile
+    if out_path is None:
+        fd, out_path = tempfile.mkstemp(prefix=f"discharge_{pid}_", suffix=".html")
+        f = open(fd, "w", encoding="utf-8")
+    else:
+        f = open(out_path, "w", encoding="utf-8")
+    with f:
+        for chunk in iter_discharge_report_html(run_query, iter_query, get_logo_path, calc_age_ymd, pid, start, end):
+            f.write(chunk)
+    return out_path
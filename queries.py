@@ -0,0 +1,351 @@
+# queries.py — query helpers used by the tabs in app.py
+# Like print_utils, every function takes run_query as its first argument so it can be
+# called from the Streamlit app, the benchmarks or the CLI tools against any DB.
+import json
+
+import labels
+from form_defs import NURSE_FIELDS, PHYSIO_FIELDS, SNAPSHOT_VITALS
+
+
+# ---------------- Form snapshots ----------------
+# Every nurse shift / physio type that a save changes also gets one form_snapshots row with
+# the whole section as JSON, so reading a form back is one row instead of a pivot of the
+# EAV rows (which are still written, and still used when no snapshot covers them).
+SNAPSHOT_LOGS = {
+    "nurse": ("nurse_logs", "care_day", "shift"),
+    "physio": ("physio_logs", "log_date", "physio_type"),
+}
+
+
+def save_form_snapshot(run_query, patient_id, form, day, kind, author, ts):
+    """Snapshot one form section (nurse shift / physio type) right after a save. The payload is
+    rebuilt from the EAV rows, so values another session saved meanwhile are kept, and log_id
+    is the newest row it includes -> the snapshot id (None when the section is empty)."""
+    if form == "nurse":
+        latest, log_id = _nurse_from_logs(run_query, patient_id, day, kind)
+        values = {key: latest.get((shift, sec, fld)) for key, shift, sec, fld in NURSE_FIELDS if shift == kind}
+    else:
+        latest, log_id = _physio_from_logs(run_query, patient_id, day, kind)
+        values = {key: latest.get((sec, fld)) for key, types, sec, fld in PHYSIO_FIELDS if kind in types}
+    if log_id is None:
+        return None
+    payload = {k: v for k, v in values.items() if v not in (None, "")}
+    return run_query(
+        "INSERT INTO form_snapshots (patient_id, form, day, kind, payload, log_id, created_by_id, ts) "
+        "VALUES (?,?,?,?,?,?,?,?)",
+        (patient_id, form, day, kind, json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+         log_id, labels.for_query(run_query).id(run_query, author), ts),
+    )
+
+
+def latest_snapshots(run_query, patient_id, form, day):
+    """Latest snapshot per shift / physio type of one day, in one query -> {kind: row or None}.
+    Every kind with EAV rows that day is a key; its value is the snapshot row (payload parsed
+    into 'values') or None when it has no snapshot yet, or EAV rows newer than the snapshot
+    (written by something other than the forms, e.g. bulk_import): read those from the logs."""
+    log_table, day_col, kind_col = SNAPSHOT_LOGS[form]
+    rows = run_query(
+        f"""
+        SELECT l.kind, l.max_id, s.id, s.payload, s.ts, s.created_by_id, s.log_id
+        FROM (
+            SELECT {kind_col} AS kind, MAX(id) AS max_id FROM {log_table}
+            WHERE patient_id=? AND {day_col}=? GROUP BY {kind_col}
+        ) l
+        LEFT JOIN form_snapshots s ON s.id = (
+            SELECT MAX(id) FROM form_snapshots WHERE patient_id=? AND form=? AND day=? AND kind=l.kind
+        )
+        """,
+        (patient_id, day, patient_id, form, day),
+        fetch=True
+    ) or []
+    lab = labels.for_query(run_query)
+    out = {}
+    for r in rows:
+        if r["id"] is None or r["log_id"] < r["max_id"]:
+            out[r["kind"]] = None
+            continue
+        r["values"] = json.loads(r.pop("payload"))
+        r["created_by"] = lab.label(run_query, r.get("created_by_id"))
+        out[r["kind"]] = r
+    return out
+
+
+def vitals_series(run_query, patient_id, since, until):
+    """Vitals of the latest nurse snapshot per (care day, shift) in [since, until], oldest first.
+    Read from the generated columns (stored in idx_form_snapshots_day), not the JSON payload."""
+    cols = ", ".join(col for col, _, _ in SNAPSHOT_VITALS)
+    return run_query(
+        f"""
+        SELECT day, shift, ts, {cols} FROM (
+            SELECT day, kind AS shift, ts, {cols},
+                   ROW_NUMBER() OVER (PARTITION BY day, kind ORDER BY id DESC) AS rn
+            FROM form_snapshots
+            WHERE patient_id=? AND form='nurse' AND day BETWEEN ? AND ?
+        ) x WHERE rn = 1
+        ORDER BY day, shift DESC
+        """,
+        (patient_id, since, until),
+        fetch=True
+    ) or []
+
+
+# ---------------- Nurse / Physio prefill ----------------
+# section / field / created_by are label_dict ids (labels.py): filters look the id up in the
+# process-wide map, rows come back with the text filled in by labels.decode. Until
+# `labels.py --migrate` has run, older rows still carry the text instead (LABEL_MATCH).
+LABEL_MATCH = "((section_id=? AND field_id=?) OR (section=? AND field=?))"
+
+
+def fetch_nurse_latest(run_query, patient_id, daydate, shift, section, field):
+    lab = labels.for_query(run_query)
+    sid, fid = lab.id(run_query, section, create=False), lab.id(run_query, field, create=False)
+    rows = run_query(
+        f"""
+        SELECT value FROM nurse_logs WHERE id = (
+            SELECT MAX(id) FROM nurse_logs
+            WHERE patient_id=? AND care_day=? AND shift=? AND {LABEL_MATCH}
+        )
+        """,
+        (patient_id, daydate.isoformat(), shift, sid, fid, section, field),
+        fetch=True
+    )
+    if rows:
+        return rows[0].get("value") or ""
+    return ""
+
+
+def _nurse_from_logs(run_query, patient_id, day, shift=None):
+    """Newest nurse_logs value per (shift, section, field) of one care day (one range of
+    idx_nurse_logs_care_day) -> ({(shift, section, field): value}, newest row id or None).
+    Newest = highest id, like the physio reads and the snapshots' log_id: ts is the clock time
+    the nurse typed, and a later save (or an imported chart row) may carry an earlier one."""
+    latest, newest, log_id = {}, {}, None
+    for r in labels.decode(run_query, run_query(
+        f"""
+        SELECT id, shift, section, field, section_id, field_id, value FROM nurse_logs
+        WHERE patient_id=? AND care_day=? {"AND shift=?" if shift else ""}
+        """,
+        (patient_id, day, shift) if shift else (patient_id, day),
+        fetch=True
+    ) or []):
+        key = (r["shift"], r["section"], r["field"])
+        if r["id"] > newest.get(key, 0):
+            newest[key] = r["id"]
+            latest[key] = r.get("value") or ""
+        log_id = max(log_id or 0, r["id"])
+    return latest, log_id
+
+
+def fetch_nurse_prefill(run_query, patient_id, daydate):
+    """Latest value of every nurse form field for one care day -> {widget key: value}.
+    One snapshot row per shift; shifts without a current snapshot are read from nurse_logs."""
+    snaps = latest_snapshots(run_query, patient_id, "nurse", daydate.isoformat())
+    latest = {}
+    if None in snaps.values():
+        latest = _nurse_from_logs(run_query, patient_id, daydate.isoformat())[0]
+    return {
+        key: (snaps[shift]["values"].get(key, "") if snaps.get(shift) else latest.get((shift, section, field), ""))
+        for key, shift, section, field in NURSE_FIELDS
+    }
+
+
+def fetch_physio_latest(run_query, patient_id, log_date_iso, physio_type, section, field):
+    lab = labels.for_query(run_query)
+    sid, fid = lab.id(run_query, section, create=False), lab.id(run_query, field, create=False)
+    rows = run_query(f"""
+        SELECT value FROM physio_logs WHERE id = (
+            SELECT MAX(id) FROM physio_logs
+            WHERE patient_id=? AND log_date=? AND physio_type=? AND {LABEL_MATCH}
+        )
+        """,
+        (patient_id, log_date_iso, physio_type, sid, fid, section, field),
+        fetch=True
+    )
+    if rows:
+        return rows[0].get("value") or ""
+    return ""
+
+
+def _physio_from_logs(run_query, patient_id, log_date_iso, physio_type):
+    """Newest physio_logs value per (section, field) of one day and type (one range of
+    idx_physio_logs_day) -> ({(section, field): value}, newest row id or None)."""
+    latest, newest, log_id = {}, {}, None
+    for r in labels.decode(run_query, run_query(
+        """
+        SELECT id, section, field, section_id, field_id, value FROM physio_logs
+        WHERE patient_id=? AND log_date=? AND physio_type=?
+        """,
+        (patient_id, log_date_iso, physio_type),
+        fetch=True
+    ) or []):
+        # keyed on the decoded text: a field may have text rows and id rows until the migration ran
+        key = (r["section"], r["field"])
+        if r["id"] > newest.get(key, 0):
+            newest[key] = r["id"]
+            latest[key] = r.get("value") or ""
+        log_id = max(log_id or 0, r["id"])
+    return latest, log_id
+
+
+def fetch_physio_prefill(run_query, patient_id, log_date_iso, physio_type):
+    """Latest value of every field of the given physio type for one day -> {widget key: value}.
+    The latest snapshot, else physio_logs."""
+    snaps = latest_snapshots(run_query, patient_id, "physio", log_date_iso)
+    snap = snaps.get(physio_type)
+    if snap:
+        values = snap["values"]
+        return {key: values.get(key, "") for key, types, sec, fld in PHYSIO_FIELDS if physio_type in types}
+    latest = {}
+    if physio_type in snaps:
+        latest = _physio_from_logs(run_query, patient_id, log_date_iso, physio_type)[0]
+    return {
+        key: latest.get((sec, fld), "")
+        for key, types, sec, fld in PHYSIO_FIELDS
+        if physio_type in types
+    }
+
+
+# ---------------- Nurse log history ----------------
+def nurse_history_page(run_query, patient_id, before=None, limit=50, section=None, field=None):
+    """One page of a patient's nurse_logs, newest first -> (rows, cursor of the next page or None).
+    Keyset pagination on (ts, id): pass the returned cursor back as `before`, so every page is
+    a short index range no matter how deep the history goes."""
+    lab = labels.for_query(run_query)
+    text_rows = lab.has_text_rows(run_query, "nurse_logs")
+    where = ["patient_id=?"]
+    params = [patient_id]
+    for col, text in (("section", section), ("field", field)):
+        if text:
+            label_id = lab.id(run_query, text, create=False)
+            if text_rows:  # not migrated yet: also match rows that still carry the text
+                where.append(f"({col}_id=? OR {col}=?)")
+                params += [label_id, text]
+            elif label_id is None:
+                return [], None
+            else:
+                where.append(f"{col}_id=?")
+                params.append(label_id)
+    if before:
+        where.append("(ts, id) < (?, ?)")
+        params += [before[0], before[1]]
+    rows = run_query(
+        f"""
+        SELECT id, ts, care_day, shift, section, field, value, created_by,
+               section_id, field_id, created_by_id FROM nurse_logs
+        WHERE {' AND '.join(where)}
+        ORDER BY ts DESC, id DESC
+        LIMIT ?
+        """,
+        (*params, limit + 1),
+        fetch=True
+    ) or []
+    lab.decode(run_query, rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1]["ts"], rows[-1]["id"])
+    return rows, None
+
+
+def archived_count(run_query, patient_id, tbl="nurse_logs"):
+    """Superseded versions of a patient's rows that compact_logs.py moved to log_archive
+    (the history pages above no longer contain them)."""
+    rows = run_query("SELECT COALESCE(SUM(n_rows), 0) AS n FROM log_archive WHERE patient_id=? AND tbl=?",
+                     (patient_id, tbl), fetch=True)
+    return rows[0]["n"] if rows else 0
+
+
+# ---------------- Patient search ----------------
+def search_patients(run_query, q):
+    if not (q or "").strip():
+        return []
+    qn = q.replace(" ", "").replace("-", "").replace("/", "").lower()
+    like = f"%{qn}%"
+    return run_query(
+        """
+        SELECT id, hn, first_name, last_name, hospital, ward, photo_path
+        FROM patients
+        WHERE is_active=1 AND (
+            LOWER(REPLACE(REPLACE(REPLACE(hn, ' ', ''), '-', ''), '/', '')) LIKE ? OR
+            LOWER(REPLACE(first_name, ' ', '')) LIKE ? OR
+            LOWER(REPLACE(last_name, ' ', '')) LIKE ? OR
+            LOWER(REPLACE(ward, ' ', '')) LIKE ?
+        )
+        ORDER BY updated_at DESC
+        LIMIT 50
+        """,
+        (like, like, like, like), fetch=True
+    ) or []
+
+
+# ---------------- Medication summary ----------------
+# Display label / sort rank of one schedule slot: "<timing><meal>" for before/after-meal
+# doses of เช้า/กลางวัน/เย็น, everything else is grouped under "ยาเพิ่มเติม" at the end.
+SLOT_LABEL_SQL = """
+    CASE WHEN s.timing IN ('ก่อนอาหาร','หลังอาหาร') AND s.meal_slot IN ('เช้า','กลางวัน','เย็น')
+         THEN s.timing || s.meal_slot ELSE 'ยาเพิ่มเติม' END
+"""
+SLOT_RANK_SQL = """
+    CASE WHEN s.timing IN ('ก่อนอาหาร','หลังอาหาร') AND s.meal_slot IN ('เช้า','กลางวัน','เย็น')
+         THEN (CASE s.timing WHEN 'ก่อนอาหาร' THEN 0 ELSE 1 END)
+            + (CASE s.meal_slot WHEN 'เช้า' THEN 0 WHEN 'กลางวัน' THEN 2 ELSE 4 END)
+         ELSE 99 END
+"""
+
+
+def active_meds_summary(run_query, pid):
+    """Active medications of a patient, one row per active meal slot, sorted for display."""
+    return run_query(
+        f"""
+        SELECT s.id AS sid, m.id AS rid, s.meal_slot,
+               {SLOT_LABEL_SQL} AS label, {SLOT_RANK_SQL} AS rank,
+               m.image_path, COALESCE(m.drug_name,'') AS drug_name, COALESCE(m.drug_type,'') AS drug_type,
+               COALESCE(m.how_to,'') AS how_to, COALESCE(m.start_date,'') AS start_date, COALESCE(m.note,'') AS note
+        FROM medications m
+        JOIN medication_schedule s ON s.medication_id = m.id AND s.active = 1
+        WHERE m.patient_id=? AND COALESCE(m.active,1)=1
+        ORDER BY rank, drug_name, m.created_at DESC, s.id
+        """,
+        (pid,), fetch=True
+    ) or []
+
+
+def save_medication_schedule(run_query, med_id, meal_times, timing):
+    """Replace the schedule slots of a medication after it was inserted or edited."""
+    run_query("DELETE FROM medication_schedule WHERE medication_id=?", (med_id,))
+    run_query(
+        "INSERT INTO medication_schedule (medication_id, meal_slot, timing) VALUES (?,?,?)",
+        [(med_id, slot, timing) for slot in (meal_times or ["อื่นๆ"])],
+        many=True,
+    )
+
+
+def deactivate_medication_slot(run_query, sid):
+    """Per-meal "Inactive": one row update; trg_medsched_deactivate syncs medications."""
+    run_query("UPDATE medication_schedule SET active=0 WHERE id=?", (sid,))
+
+
+# ---------------- Pharmacy pick list ----------------
+MEAL_SLOTS = ["เช้า", "กลางวัน", "เย็น", "ก่อนนอน", "อื่นๆ"]
+TIMINGS = ["ก่อนอาหาร", "หลังอาหาร", "อื่นๆ"]
+
+
+def pharmacy_pick_list(run_query, meal_slot, timing=None):
+    """Facility-wide doses for one meal slot (optionally one timing), grouped by ward and drug."""
+    where_timing = "AND s.timing=?" if timing else ""
+    params = (meal_slot, timing) if timing else (meal_slot,)
+    return run_query(
+        f"""
+        SELECT COALESCE(NULLIF(p.ward,''),'-') AS ward,
+               COALESCE(m.drug_name,'-') AS drug_name, COALESCE(m.drug_type,'') AS drug_type,
+               s.timing AS timing, COUNT(*) AS doses,
+               group_concat(COALESCE(p.hn,'-') || ' ' || COALESCE(p.first_name,''), ', ') AS patients
+        FROM medication_schedule s
+        JOIN medications m ON m.id = s.medication_id
+        JOIN patients p ON p.id = m.patient_id
+        WHERE s.meal_slot=? {where_timing} AND s.active=1
+          AND COALESCE(m.active,1)=1 AND p.is_active=1
+        GROUP BY ward, m.drug_name, m.drug_type, s.timing
+        ORDER BY ward, drug_name, s.timing
+        """,
+        params, fetch=True
+    ) or []
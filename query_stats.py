@@ -0,0 +1,127 @@
+# query_stats.py — per-rerun query collector and slow-query log for db.run_query
+# Every run_query call is recorded (SQL fingerprint, parameter shape, row count, duration)
+# into a collector owned by the current thread — Streamlit runs each session's script in
+# its own thread, so "current thread" == "current rerun" once begin_rerun() is called.
+#
+# Env:
+#   HH_SLOW_QUERY_MS   threshold in ms for the slow log (default 200, 0 disables)
+#   HH_SLOW_QUERY_LOG  JSONL file for slow queries (default slow_queries.jsonl)
+#   HH_DEBUG           show the per-rerun panel in the sidebar
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+DEBUG = os.getenv("HH_DEBUG", "").strip().lower() in ("1", "true", "yes", "on")
+SLOW_MS = float(os.getenv("HH_SLOW_QUERY_MS", "200") or 0)
+SLOW_LOG = os.getenv("HH_SLOW_QUERY_LOG", "slow_queries.jsonl")
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_listeners = []
+_STR_RE = re.compile(r"'(?:[^']|'')*'")
+_NUM_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WS_RE = re.compile(r"\s+")
+_INLIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def fingerprint(sql):
+    """Normalize a statement so calls that differ only by literals group together."""
+    s = _STR_RE.sub("?", sql)
+    s = _NUM_RE.sub("?", s)
+    s = _WS_RE.sub(" ", s).strip()
+    return _INLIST_RE.sub("(?+)", s)
+
+
+def params_shape(params, many=False):
+    if many:
+        params = list(params)
+        inner = params_shape(params[0]) if params else "()"
+        return f"{len(params)}x{inner}"
+    if isinstance(params, dict):
+        return "{" + ",".join(sorted(params)) + "}"
+    return "(" + ",".join(type(p).__name__ for p in (params or ())) + ")"
+
+
+def begin_rerun():
+    """Start a fresh collector for the current thread (call at the top of each rerun)."""
+    _local.records = []
+
+
+def current():
+    return getattr(_local, "records", None) or []
+
+
+def record(db_path, sql, params, many, rows, ms, error=None):
+    rec = {
+        "fp": fingerprint(sql),
+        "shape": params_shape(params, many),
+        "rows": rows,
+        "ms": round(ms, 3),
+    }
+    if error:
+        rec["error"] = error
+    records = getattr(_local, "records", None)
+    if records is not None:
+        records.append(rec)
+    for fn in _listeners:
+        fn(rec)
+    if SLOW_MS and ms >= SLOW_MS and SLOW_LOG:
+        _log_slow(db_path, sql, params, many, rec)
+    return rec
+
+
+def add_listener(fn):
+    """Call fn(rec) for every recorded query in any thread (load tests, external collectors)."""
+    _listeners.append(fn)
+
+
+def explain(db_path, sql, params=()):
+    """EXPLAIN QUERY PLAN details as a list of strings (empty if the statement can't be explained
+    or the DB isn't a SQLite file)."""
+    if not db_path:
+        return []
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error:
+        return []
+
+
+def _log_slow(db_path, sql, params, many, rec):
+    entry = dict(rec)
+    entry["at"] = datetime.now().isoformat(timespec="seconds")
+    entry["sql"] = _WS_RE.sub(" ", sql).strip()
+    entry["plan"] = explain(db_path, sql, () if many else params)
+    try:
+        with _log_lock, open(SLOW_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def summary(records=None, top=5):
+    """(count, total ms, top fingerprints by total time) for a list of records."""
+    records = current() if records is None else records
+    agg = {}
+    for r in records:
+        a = agg.setdefault(r["fp"], {"fp": r["fp"], "n": 0, "ms": 0.0, "rows": 0})
+        a["n"] += 1
+        a["ms"] += r["ms"]
+        a["rows"] += r["rows"] or 0
+    worst = sorted(agg.values(), key=lambda a: -a["ms"])[:top]
+    return len(records), sum(r["ms"] for r in records), worst
+
+
+def render_debug_panel(st):
+    """Sidebar panel with this rerun's query count and top offenders (HH_DEBUG only)."""
+    if not DEBUG:
+        return
+    n, total, worst = summary()
+    with st.sidebar.expander(f"🐞 Queries: {n} • {total:.1f} ms", expanded=False):
+        for a in worst:
+            st.caption(f"{a['ms']:.1f} ms • {a['n']}× • {a['rows']} rows")
+            st.code(a["fp"][:300], language="sql")
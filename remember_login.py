@@ -3,7 +3,7 @@
 # - Requires: streamlit>=1.25 (uses st.query_params), your app must provide run_query(sql, params, fetch)
 # - Set HH_SECRET in environment for stronger signing, else fallback to a default (change it!)
 import os, hashlib, secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import streamlit as st
 
 def _secret() -> str:
@@ -15,20 +15,14 @@ def _hash_token(token: str) -> str:
     m.update((token + _secret()).encode("utf-8"))
     return m.hexdigest()
 
+def _utc(delta_days: int = 0) -> str:
+    # same text format as the DB's created_at defaults (UTC)
+    return (datetime.now(timezone.utc) + timedelta(days=delta_days)).strftime("%Y-%m-%d %H:%M:%S")
+
 def ensure_tables(run_query):
-    run_query(
-        """
-        CREATE TABLE IF NOT EXISTS auth_tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token_hash TEXT NOT NULL,
-            created_at TEXT DEFAULT (datetime('now')),
-            expires_at TEXT,
-            is_revoked INTEGER DEFAULT 0
-        );
-        CREATE INDEX IF NOT EXISTS idx_auth_token_hash ON auth_tokens(token_hash);
-        """
-    )
+    # auth_tokens is part of the schema created by db.init_db (SQLite and Postgres);
+    # kept so existing callers don't break
+    return None
 
 def _set_query_param_token(token: str):
     try:
@@ -53,7 +47,7 @@ def create_persistent_login(user_id: int, run_query, days_valid: int = 30) -> st
     ensure_tables(run_query)
     token = secrets.token_urlsafe(32)
     token_hash = _hash_token(token)
-    exp = (datetime.utcnow() + timedelta(days=days_valid)).strftime("%Y-%m-%d %H:%M:%S")
+    exp = _utc(days_valid)
     run_query("INSERT INTO auth_tokens (user_id, token_hash, expires_at) VALUES (?,?,?)", (user_id, token_hash, exp))
     _set_query_param_token(token)
     return token
@@ -74,17 +68,17 @@ def get_user_from_token(run_query):
         SELECT s.id, s.name, s.role, COALESCE(s.username, s.email) AS username
         FROM auth_tokens t
         JOIN staff s ON s.id = t.user_id
-        WHERE t.token_hash=? AND t.is_revoked=0 AND (t.expires_at IS NULL OR t.expires_at >= datetime('now')) AND s.is_active=1
+        WHERE t.token_hash=? AND t.is_revoked=0 AND (t.expires_at IS NULL OR t.expires_at >= ?) AND s.is_active=1
         ORDER BY t.id DESC LIMIT 1
         """,
-        (token_hash,), fetch=True
+        (token_hash, _utc()), fetch=True
     )
     if not rows: 
         return None
     u = rows[0]
     # Optional: extend expiry (sliding window)
     try:
-        run_query("UPDATE auth_tokens SET expires_at=datetime('now','+30 days') WHERE token_hash=? AND is_revoked=0", (token_hash,))
+        run_query("UPDATE auth_tokens SET expires_at=? WHERE token_hash=? AND is_revoked=0", (_utc(30), token_hash))
     except Exception:
         pass
     return {"id": u["id"], "name": u["name"], "role": u["role"], "username": u["username"]}
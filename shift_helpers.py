@@ -1,12 +1,51 @@
 # shift_helpers.py
-from datetime import time
+# Shift boundaries (env HH_SHIFT_DAY_START / HH_SHIFT_NIGHT_START, default 07:00 / 19:00).
+# A nurse "care day" D is the calendar date D: its night block is "เมื่อคืน", the night that
+# ends on the morning of D, so a night entry written at 02:00 belongs to that same date (as
+# the form always saved it: ts = selected date + clock time).
+# nurse_logs.care_day stores it, which makes "everything for day D" one indexed range.
+import os
+from datetime import date, datetime, time
+
+
+def _hhmm(name, default):
+    try:
+        return time.fromisoformat(os.getenv(name, default) or default)
+    except ValueError:
+        return time.fromisoformat(default)
+
+
+DAY_START = _hhmm("HH_SHIFT_DAY_START", "07:00")
+NIGHT_START = _hhmm("HH_SHIFT_NIGHT_START", "19:00")
+
+
+def shift_of(t):
+    """'day' or 'night' for a clock time."""
+    return 'day' if DAY_START <= t < NIGHT_START else 'night'
+
+
+def care_day(ts=None):
+    """Care day of a timestamp (datetime or 'YYYY-MM-DD HH:MM[:SS]', default now) -> date.
+    Used where the day isn't given explicitly (the form's default date, tools that only
+    have a clock time); the app and bulk_import store the day the entry was made for.
+    Night hours after midnight belong to the current date (the form's "เมื่อคืน" block)."""
+    if ts is None:
+        return date.today()
+    if isinstance(ts, str):
+        return date.fromisoformat(ts.strip()[:10])
+    if isinstance(ts, datetime):
+        return ts.date()
+    return ts
+
 
 def shift_picker(st, label='เวร', key='vitals_shift'):
     """Return (shift_code, shift_time).
     shift_code: 'day' or 'night'
-    shift_time: time(7,0) for day, time(19,0) for night
+    shift_time: DAY_START for day, NIGHT_START for night
     """
-    choices = ['กลางวัน (07:00-19:00)', 'กลางคืน (19:00-07:00)']
+    day_lbl = f"{DAY_START:%H:%M}-{NIGHT_START:%H:%M}"
+    night_lbl = f"{NIGHT_START:%H:%M}-{DAY_START:%H:%M}"
+    choices = [f'กลางวัน ({day_lbl})', f'กลางคืน ({night_lbl})']
     sel = st.radio(label, choices, horizontal=True, key=key)
     is_day = sel.startswith('กลางวัน')
-    return ('day' if is_day else 'night'), (time(7,0) if is_day else time(19,0))
+    return ('day' if is_day else 'night'), (DAY_START if is_day else NIGHT_START)
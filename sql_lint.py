@@ -0,0 +1,230 @@
+# sql_lint.py — offline query-plan check of every SQL statement in the app's source
+# Slow queries usually only show up once production data has grown. This collects the SQL
+# string literals of the given modules with `ast` (adjacent / `+`-joined literals and
+# f-strings over module-level constants are folded; anything built at runtime is skipped and
+# counted), runs EXPLAIN QUERY PLAN for each against the synthetic DB that bench.py uses, and
+# reports:
+#   scan          SCAN of a table with more than --min-rows rows (no index used)
+#   temp-btree    USE TEMP B-TREE (ORDER BY / GROUP BY / DISTINCT sorted at query time)
+#   non-sargable  a predicate that wraps a column in a function (date(ts)=?, substr(ts,...),
+#                 COALESCE(active,1)=1, LOWER(REPLACE(hn,...)) LIKE ?), which no plain index serves
+# Scans and sorts of statements that only touch tables of up to --min-rows rows (staff,
+# label_dict, ...) pass; non-sargable predicates are reported whatever the table size.
+#
+# Exit status is 1 when there is a finding that the baseline doesn't list, so the run can
+# gate CI the same way `bench.py --compare` does.
+#
+# Run:
+#   python sql_lint.py                                   # default modules, /tmp/hh_bench.db
+#   python sql_lint.py queries.py api.py -v              # other files, print every statement
+#   python sql_lint.py --save sql_lint_baseline.json     # accept the current findings
+#   python sql_lint.py --baseline other.json             # fail only on findings not in other.json
+#
+# sql_lint_baseline.json (next to this file, used by default) lists the accepted findings:
+# per-patient sorts of a handful of rows, the medication date / active filters, and the
+# fuzzy patient search (queries.search_patients: LIKE '%q%' over normalized hn / names, which
+# no index would serve anyway). Remove an entry once its query is fixed.
+import argparse
+import ast
+import json
+import re
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+
+import bench
+import db
+import query_stats
+
+FILES = ("app.py", "print_utils.py", "remember_login.py", "queries.py")
+MIN_ROWS = 1000
+BASELINE = str(Path(__file__).with_name("sql_lint_baseline.json"))
+
+_SQL_START = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_SQL_BODY = re.compile(r"\b(FROM|INTO|SET)\b", re.IGNORECASE)
+_STRING_OR_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\?")
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|LEFT|INNER|ON|USING|"
+                        r"GROUP|ORDER|LIMIT|SET|VALUES|SELECT|CROSS|NATURAL)\b)(\w+))?", re.IGNORECASE)
+_PLAN_TABLE = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+# function(column ...) at the start of a predicate: WHERE / ON / AND / OR / NOT f(col...)
+_NON_SARGABLE = re.compile(
+    r"\b(?:WHERE|ON|AND|OR|NOT)\s+\(?\s*((?:substr|date|datetime|strftime|julianday|lower|upper|replace|trim|"
+    r"coalesce|ifnull|cast)\s*\((?:\s*\w+\s*\()*\s*[A-Za-z_][\w.]*)", re.IGNORECASE)
+
+
+# ---------------- collecting ----------------
+def _module_constants(tree):
+    """Module-level NAME = 'literal' assignments (used to fold f-strings like SLOT_LABEL_SQL)."""
+    out = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            v = _fold(node.value, out)
+            if v is not None:
+                out[node.targets[0].id] = v
+    return out
+
+
+def _fold(node, consts):
+    """Source string of a literal expression, or None if it depends on runtime values."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        a, b = _fold(node.left, consts), _fold(node.right, consts)
+        return a + b if a is not None and b is not None else None
+    if isinstance(node, ast.Name):
+        return consts.get(node.id)
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for v in node.values:
+            if isinstance(v, ast.FormattedValue):
+                v = v.value
+            s = _fold(v, consts)
+            if s is None:
+                return None
+            parts.append(s)
+        return "".join(parts)
+    return None
+
+
+def _looks_like_sql(s):
+    return bool(_SQL_START.match(s) and _SQL_BODY.search(s))
+
+
+def _has_sql_head(node):
+    """First literal piece of a string expression starts like a statement (for the skipped count)."""
+    while isinstance(node, ast.BinOp):
+        node = node.left
+    if isinstance(node, ast.JoinedStr) and node.values and isinstance(node.values[0], ast.Constant):
+        node = node.values[0]
+    return isinstance(node, ast.Constant) and isinstance(node.value, str) and bool(_SQL_START.match(node.value))
+
+
+def collect(path):
+    """SQL statements of one source file -> ([(line, sql)], lines of statements built at runtime)."""
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"), filename=str(path))
+    consts = _module_constants(tree)
+    found, dynamic, seen = [], [], set()
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.Constant, ast.BinOp, ast.JoinedStr)) or id(node) in seen:
+            continue
+        s = _fold(node, consts)
+        if s is not None:
+            # the parts of a folded expression are not statements of their own
+            seen.update(id(n) for n in ast.walk(node))
+            if _looks_like_sql(s):
+                found.append((node.lineno, s))
+        elif isinstance(node, (ast.BinOp, ast.JoinedStr)) and _has_sql_head(node):
+            seen.update(id(n) for n in ast.walk(node))
+            dynamic.append(node.lineno)
+    return sorted(found), sorted(dynamic)
+
+
+# ---------------- checking ----------------
+def _params(sql):
+    return [None] * sum(1 for m in _STRING_OR_PLACEHOLDER.finditer(sql) if m.group(0) == "?")
+
+
+def _aliases(sql):
+    """alias or table name -> table name."""
+    out = {}
+    for m in _TABLE_REF.finditer(sql):
+        out[m.group(1)] = m.group(1)
+        if m.group(2):
+            out[m.group(2)] = m.group(1)
+    return out
+
+
+def check(conn, sql, row_counts, min_rows=MIN_ROWS):
+    """Findings of one statement -> (plan detail lines, [(rule, detail)]); raises sqlite3.Error."""
+    plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, _params(sql)).fetchall()]
+    aliases = _aliases(sql)
+    findings = []
+    # a wrapped column is reported whatever the table size: small tables grow
+    if not any("<expr>" in d for d in plan):  # an expression index serves the wrapped column
+        for m in _NON_SARGABLE.finditer(sql):
+            findings.append(("non-sargable", re.sub(r"\s+", " ", m.group(1)) + "...)"))
+    # scans and sorts only matter when some table involved is large
+    if all(row_counts.get(t, 0) <= min_rows for t in set(aliases.values())):
+        return plan, findings
+    for detail in plan:
+        if detail.startswith("SCAN "):
+            name = _PLAN_TABLE.match(detail).group(1)
+            table = aliases.get(name, name)
+            if table in row_counts and row_counts[table] > min_rows:
+                findings.append(("scan", f"{detail} ({row_counts[table]:,} rows)"))
+        elif "USE TEMP B-TREE" in detail:
+            findings.append(("temp-btree", detail))
+    return plan, findings
+
+
+def row_counts(conn):
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    return {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+
+
+def key(path, sql, rule):
+    """Baseline key: file + normalized statement + rule (line numbers move too often)."""
+    return f"{Path(path).name}|{query_stats.fingerprint(sql)}|{rule}"
+
+
+def lint(files, db_path, min_rows=MIN_ROWS, verbose=False, log=print):
+    """Lint every statement of files against db_path -> (findings [(file, line, sql, rule, detail)], stats)."""
+    findings, stats = [], {"statements": 0, "dynamic": 0, "errors": 0}
+    with closing(sqlite3.connect(db_path)) as conn:
+        counts = row_counts(conn)
+        for path in files:
+            found, dynamic = collect(path)
+            stats["statements"] += len(found)
+            stats["dynamic"] += len(dynamic)
+            for line, sql in found:
+                try:
+                    plan, fs = check(conn, sql, counts, min_rows)
+                except sqlite3.Error as e:
+                    stats["errors"] += 1
+                    log(f"{path}:{line}: cannot plan ({e}): {query_stats.fingerprint(sql)[:120]}")
+                    continue
+                if verbose:
+                    log(f"{path}:{line}: {query_stats.fingerprint(sql)[:120]}")
+                    for d in plan:
+                        log(f"    {d}")
+                findings += [(path, line, sql, rule, detail) for rule, detail in fs]
+            if verbose and dynamic:
+                log(f"{path}: built at runtime, not checked: lines {', '.join(map(str, dynamic))}")
+    return findings, stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN every SQL literal of the app on a synthetic DB")
+    ap.add_argument("files", nargs="*", default=list(FILES))
+    ap.add_argument("--db", default="/tmp/hh_bench.db", help="synthetic DB (built like bench.py if missing)")
+    ap.add_argument("--patients", type=int, default=200)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--min-rows", type=int, default=MIN_ROWS, help="scans of smaller tables are fine")
+    ap.add_argument("--baseline", default=BASELINE if Path(BASELINE).exists() else None,
+                    help="JSON from --save: only findings missing from it fail (default sql_lint_baseline.json if present)")
+    ap.add_argument("--save", help="write the current findings as a baseline")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print every statement and its plan")
+    args = ap.parse_args(argv)
+
+    bench.prepare_db(args.db, args.patients, args.days)
+    findings, stats = lint(args.files, db.DB_PATH, args.min_rows, args.verbose)
+    accepted = set(json.loads(Path(args.baseline).read_text())["accepted"]) if args.baseline else set()
+    new = 0
+    for path, line, sql, rule, detail in findings:
+        known = key(path, sql, rule) in accepted
+        new += not known
+        print(f"{path}:{line}: {rule}{' (baseline)' if known else ''}: {detail}")
+        print(f"    {query_stats.fingerprint(sql)[:160]}")
+    print(f"{stats['statements']} statements checked, {stats['dynamic']} built at runtime (skipped), "
+          f"{stats['errors']} could not be planned, {len(findings)} findings, {new} not in baseline")
+    if args.save:
+        Path(args.save).write_text(json.dumps(
+            {"accepted": sorted({key(p, s, r) for p, _, s, r, _ in findings})}, indent=2, ensure_ascii=False))
+        print(f"baseline written to {args.save}")
+        return 0
+    return 1 if new or stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# synth_data.py — fill a throwaway clinic.db with realistic-looking synthetic data
+# Run:
+#   python synth_data.py --db /tmp/bench.db --patients 200 --days 90
+#
+# Rows are shaped like the real forms: every nurse save writes all filled fields of a
+# shift with one timestamp (and some saves are repeated, as happens when a nurse corrects
+# one value), physio saves write one physio type per day, medications use the same
+# comma-joined meal_times / timing_radio values as the medication form.
+# Never point --db at the production clinic.db.
+import argparse
+import random
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import db
+from form_defs import NURSE_FIELDS, PHYSIO_FIELDS
+
+WARDS = ["A1", "A2", "B1", "B2", "ICU", "Rehab"]
+FIRST_NAMES = ["สมชาย", "สมหญิง", "วิชัย", "มาลี", "ประเสริฐ", "อรุณี", "สุนทร", "จันทร์เพ็ญ", "บุญมี", "กาญจนา"]
+LAST_NAMES = ["ใจดี", "สุขสวัสดิ์", "ทองคำ", "ศรีสุข", "มั่นคง", "พานิช", "รุ่งเรือง", "แก้วมณี"]
+DRUGS = [
+    ("Amlodipine 5 mg", "ยาเม็ด"), ("Metformin 500 mg", "ยาเม็ด"), ("Omeprazole 20 mg", "แคปซูล"),
+    ("Paracetamol 500 mg", "ยาเม็ด"), ("Simvastatin 20 mg", "ยาเม็ด"), ("Losartan 50 mg", "ยาเม็ด"),
+    ("Senokot", "ยาเม็ด"), ("Lactulose", "ยาน้ำ"), ("Aspirin 81 mg", "ยาเม็ด"), ("Furosemide 40 mg", "ยาเม็ด"),
+    ("Insulin RI", "ยาฉีด"), ("Vitamin B1-6-12", "ยาเม็ด"),
+]
+MEAL_SETS = [
+    ["เช้า"], ["เช้า", "เย็น"], ["เช้า", "กลางวัน", "เย็น"], ["ก่อนนอน"], ["เช้า", "ก่อนนอน"], ["อื่นๆ"],
+]
+TIMINGS = ["ก่อนอาหาร", "หลังอาหาร", "หลังอาหาร", "อื่นๆ"]
+NURSE_VALUES = {
+    "T/อุณหภูมิ": lambda r: f"{r.uniform(36.0, 38.5):.1f}",
+    "BP/ความดัน": lambda r: f"{r.randint(100, 160)}/{r.randint(60, 95)}",
+    "HR/อัตราการเต้นหัวใจ": lambda r: str(r.randint(60, 110)),
+    "RR/อัตราการหายใจ": lambda r: str(r.randint(14, 24)),
+    "SpO2/ค่าออกซิเจน": lambda r: str(r.randint(92, 100)),
+    "DTX/ระดับน้ำตาลในเลือด": lambda r: str(r.randint(80, 220)),
+    "Intake/น้ำเข้าร่างกาย": lambda r: str(r.randrange(800, 2400, 50)),
+    "Output/ปัสสาวะ": lambda r: str(r.randint(3, 9)),
+    "Stool/อุจจาระ": lambda r: str(r.randint(0, 2)),
+}
+
+# Legacy tables of older installs, input for migrate_legacy.py
+LEGACY_DDL = """
+CREATE TABLE IF NOT EXISTS vitals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER, ts TEXT, shift TEXT,
+    temperature TEXT, bp TEXT, heart_rate TEXT, resp_rate TEXT, spo2 TEXT, dtx TEXT,
+    intake_ml TEXT, output_times TEXT, stool TEXT, note TEXT,
+    caregiver_name TEXT, head_nurse_name TEXT, created_by TEXT,
+    created_at TEXT DEFAULT (datetime('now'))
+);
+CREATE TABLE IF NOT EXISTS physio_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER, session_date TEXT,
+    pre_bp TEXT, pre_hr TEXT, post_bp TEXT, post_hr TEXT,
+    activity TEXT, result TEXT, note TEXT, therapist TEXT, created_by TEXT,
+    created_at TEXT DEFAULT (datetime('now'))
+);
+"""
+
+
+def _nurse_value(rnd, field):
+    gen = NURSE_VALUES.get(field)
+    if gen:
+        return gen(rnd)
+    return rnd.choice(["ปกติ", "ดี", "เล็กน้อย", "ไม่มี", "พอใช้"])
+
+
+def generate(db_path, patients=100, days=30, seed=1, end=None, resave_rate=0.3, legacy=False, snapshots=True):
+    """Create the schema at db_path and fill it. Returns {table: rows inserted}."""
+    rnd = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")  # no chart rows in the future (today's are partial)
+    db.init_db(db_path)
+    counts = {}
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute("PRAGMA synchronous=OFF")
+        with conn:
+            conn.executemany(
+                "INSERT INTO patients (hn, first_name, last_name, dob, ward, weight, height, hospital, blood_group, "
+                "drug_allergy, admission_date, feeding, foley, is_active) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,1)",
+                [
+                    (
+                        f"HN{i:06d}", rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES),
+                        f"{rnd.randint(1930, 1970)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                        rnd.choice(WARDS), round(rnd.uniform(40, 90), 1), round(rnd.uniform(145, 180), 1),
+                        "รพ.ตัวอย่าง", rnd.choice(["A Rh+", "B Rh+", "O Rh+", "AB Rh+"]),
+                        rnd.choice(["", "", "Penicillin", "Aspirin", "Sulfa"]), start.isoformat(),
+                        rnd.choice(["oral", "NG"]), rnd.randint(0, 1),
+                    )
+                    for i in range(1, patients + 1)
+                ],
+            )
+            pids = [(r[0], r[1]) for r in conn.execute("SELECT id, hn FROM patients ORDER BY id DESC LIMIT ?", (patients,))]
+        counts["patients"] = len(pids)
+
+        nurse_sql = "INSERT INTO nurse_logs (patient_id, hn, ts, shift, section, field, value, created_by, care_day) VALUES (?,?,?,?,?,?,?,?,?)"
+        physio_sql = "INSERT INTO physio_logs (patient_id, log_date, physio_type, section, field, value, created_by) VALUES (?,?,?,?,?,?,?)"
+        n_nurse = n_physio = 0
+        for d in range(days):
+            day = (start + timedelta(days=d)).isoformat()
+            nurse_rows, physio_rows = [], []
+            for pid, hn in pids:
+                for shift, hhmm in (("night", "06:30"), ("day", "17:30")):
+                    saves = 2 if rnd.random() < resave_rate else 1
+                    for s in range(saves):
+                        ts = f"{day} {hhmm[:3]}{int(hhmm[3:]) + 10 * s:02d}"
+                        if ts > now:
+                            continue
+                        for _, f_shift, section, field in NURSE_FIELDS:
+                            if f_shift != shift or rnd.random() < 0.15:
+                                continue
+                            nurse_rows.append((pid, hn, ts, shift, section, field, _nurse_value(rnd, field), "พยาบาลทดสอบ", day))
+                if rnd.random() < 0.6:
+                    ptype = rnd.choice(["basic", "rehab"])
+                    for _, types, section, field in PHYSIO_FIELDS:
+                        if ptype in types and rnd.random() < 0.8:
+                            physio_rows.append((pid, day, ptype, section, field, str(rnd.randint(1, 60)), "นักกายภาพทดสอบ"))
+            with conn:  # one transaction per simulated day
+                conn.executemany(nurse_sql, nurse_rows)
+                conn.executemany(physio_sql, physio_rows)
+            n_nurse += len(nurse_rows)
+            n_physio += len(physio_rows)
+        counts["nurse_logs"] = n_nurse
+        counts["physio_logs"] = n_physio
+
+        med_rows = []
+        for pid, _ in pids:
+            for _ in range(rnd.randint(3, 8)):
+                drug, dtype = rnd.choice(DRUGS)
+                active = 1 if rnd.random() < 0.8 else 0
+                sd = start + timedelta(days=rnd.randint(0, max(days - 1, 0)))
+                med_rows.append((
+                    pid, ",".join(rnd.choice(MEAL_SETS)), rnd.choice(TIMINGS), drug, dtype,
+                    "รับประทานครั้งละ 1 เม็ด", "เภสัชกรทดสอบ", "เภสัชกรทดสอบ",
+                    sd.isoformat(), active, None if active else end.isoformat(), f"{sd.isoformat()} 09:00:00",
+                ))
+        with conn:
+            conn.executemany(
+                "INSERT INTO medications (patient_id, meal_times, timing_radio, drug_name, drug_type, how_to, "
+                "responsible, created_by, start_date, active, inactive_date, created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                med_rows,
+            )
+        counts["medications"] = len(med_rows)
+
+        if legacy:
+            conn.executescript(LEGACY_DDL)
+            v_rows, s_rows = [], []
+            for pid, _ in pids:
+                for d in range(days):
+                    day = (start + timedelta(days=d)).isoformat()
+                    for shift, hhmm in (("night", "02:00"), ("day", "10:00")):
+                        if f"{day} {hhmm}" > now:
+                            continue
+                        v_rows.append((
+                            pid, f"{day} {hhmm}", shift, _nurse_value(rnd, "T/อุณหภูมิ"), _nurse_value(rnd, "BP/ความดัน"),
+                            _nurse_value(rnd, "HR/อัตราการเต้นหัวใจ"), _nurse_value(rnd, "RR/อัตราการหายใจ"),
+                            _nurse_value(rnd, "SpO2/ค่าออกซิเจน"), _nurse_value(rnd, "DTX/ระดับน้ำตาลในเลือด"),
+                            _nurse_value(rnd, "Intake/น้ำเข้าร่างกาย"), _nurse_value(rnd, "Output/ปัสสาวะ"),
+                            _nurse_value(rnd, "Stool/อุจจาระ"), "", "ผู้ดูแลทดสอบ", "หัวหน้าเวรทดสอบ", "legacy",
+                        ))
+                    if rnd.random() < 0.5:
+                        s_rows.append((pid, day, "120/80", "80", "125/82", "88", "เดิน 20 ม.", "ดี", "", "นักกายภาพทดสอบ", "legacy"))
+            with conn:
+                conn.executemany(
+                    "INSERT INTO vitals (patient_id, ts, shift, temperature, bp, heart_rate, resp_rate, spo2, dtx, intake_ml, "
+                    "output_times, stool, note, caregiver_name, head_nurse_name, created_by) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                    v_rows,
+                )
+                conn.executemany(
+                    "INSERT INTO physio_sessions (patient_id, session_date, pre_bp, pre_hr, post_bp, post_hr, activity, result, "
+                    "note, therapist, created_by) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                    s_rows,
+                )
+            counts["vitals"] = len(v_rows)
+            counts["physio_sessions"] = len(s_rows)
+    db.encode_log_labels(db_path)  # rows above carry the label text; store them as the app does
+    db.init_db(db_path)  # derived tables (medication_schedule, ...) are backfilled from the rows above
+    if snapshots:
+        counts["form_snapshots"] = _snapshots(db_path)
+    return counts
+
+
+def _snapshots(db_path):
+    """The form_snapshots row the app writes after each save, for every generated shift / physio day."""
+    import labels
+    from queries import save_form_snapshot
+    with closing(sqlite3.connect(db_path)) as conn:
+        rq = labels.conn_query(conn)
+        sections = [("nurse", *r) for r in conn.execute("SELECT DISTINCT patient_id, care_day, shift FROM nurse_logs")]
+        sections += [("physio", *r) for r in conn.execute("SELECT DISTINCT patient_id, log_date, physio_type FROM physio_logs")]
+        with conn:
+            for form, pid, day, kind in sections:
+                save_form_snapshot(rq, pid, form, day, kind, "พยาบาลทดสอบ" if form == "nurse" else "นักกายภาพทดสอบ",
+                                   f"{day} {'17:30' if kind == 'day' else '06:30'}")
+    return len(sections)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a synthetic clinic.db for benchmarks and load tests")
+    ap.add_argument("--db", required=True, help="output SQLite file (must not be the production clinic.db)")
+    ap.add_argument("--patients", type=int, default=100)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--legacy", action="store_true", help="also fill the legacy vitals/physio_sessions tables")
+    ap.add_argument("--no-snapshots", action="store_true", help="leave form_snapshots empty (EAV-only reads)")
+    ap.add_argument("--overwrite", action="store_true")
+    args = ap.parse_args(argv)
+
+    out = Path(args.db)
+    if out.resolve() == Path(db.DB_PATH).resolve():
+        print(f"refusing to write into the app database {db.DB_PATH}")
+        return 1
+    if out.exists():
+        if not args.overwrite:
+            print(f"{out} exists (use --overwrite)")
+            return 1
+        for p in (out, Path(f"{out}-wal"), Path(f"{out}-shm")):
+            p.unlink(missing_ok=True)
+    t0 = time.perf_counter()
+    counts = generate(str(out), args.patients, args.days, args.seed, legacy=args.legacy,
+                      snapshots=not args.no_snapshots)
+    print(", ".join(f"{k}={v:,}" for k, v in counts.items()) + f" in {time.perf_counter() - t0:.1f}s -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())